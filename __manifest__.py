@@ -3,7 +3,7 @@
 
 {
     'name': 'Helpdesk',
-    'version': '1.4',
+    'version': '1.10',
     'author': "Sigma Rectrix, Alif Ibrahim, Irfan Asyraf, Zulfa Iza",
     'category': 'Services/Helpdesk',
     'sequence': 110,
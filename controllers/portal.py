@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
+import base64
+import binascii
+import hashlib
+import json
+from datetime import datetime
 from operator import itemgetter
 
 from markupsafe import Markup
+from werkzeug.urls import url_encode
 
 from odoo import http
 from odoo.exceptions import AccessError, MissingError, UserError
@@ -11,6 +17,7 @@ from odoo.http import request
 from odoo.tools.translate import _
 from odoo.tools import groupby as groupbyelem
 from odoo.addons.portal.controllers import portal
+from odoo.addons.helpdesk.models.helpdesk_ticket import SEARCH_WEIGHT_DESCRIPTION, SEARCH_WEIGHT_MESSAGE, SEARCH_WEIGHT_SUBJECT
 from odoo.addons.portal.controllers.portal import pager as portal_pager
 from odoo.osv.expression import OR, AND
 
@@ -25,7 +32,7 @@ class CustomerPortal(portal.CustomerPortal):
         values = super()._prepare_home_portal_values(counters)
         if 'ticket_count' in counters:
             values['ticket_count'] = (
-                request.env['helpdesk.ticket'].search_count(self._prepare_helpdesk_tickets_domain())
+                request.env['helpdesk.ticket']._get_approximate_count(self._prepare_helpdesk_tickets_domain())
                 if request.env['helpdesk.ticket'].check_access_rights('read', raise_exception=False)
                 else 0
             )
@@ -41,26 +48,108 @@ class CustomerPortal(portal.CustomerPortal):
         }
         return self._get_page_view_values(ticket, access_token, values, 'my_tickets_history', False, **kwargs)
 
+    def _ticket_keyset_order(self, order, reverse=False):
+        """ Parse an order of the tickets, e.g. 'create_date desc, id desc', ending with the identifier
+            :returns a list of (field name, ascending)
+        """
+        result = []
+        for item in order.split(','):
+            field_name, *direction = item.split()
+            ascending = not direction or direction[0].lower() == 'asc'
+            result.append((field_name, ascending != reverse))
+        return result
+
+    def _ticket_keyset_key(self, sortby, domain):
+        """ Key of a list of tickets browsed with cursors: the cursors of a list are only valid in the same list,
+            with the same sorting and the same domain (filter, dates and search)
+        """
+        return '%s-%s' % (sortby, hashlib.sha1(repr(domain).encode()).hexdigest()[:16])
+
+    def _ticket_keyset_cursor(self, ticket, keyset_order, key=None):
+        """ Cursor of the given ticket in the list: the values of the fields of the order and the key of the
+            list (see `_ticket_keyset_key`), encoded for an url
+        """
+        values = []
+        for field_name, dummy in keyset_order:
+            value = ticket[field_name]
+            if isinstance(value, datetime):
+                # keep the microseconds of the creation dates, to find the same ticket again
+                value = value.strftime('%Y-%m-%d %H:%M:%S.%f')
+            values.append(value if value is not False else None)
+        return base64.urlsafe_b64encode(json.dumps({'key': key, 'values': values}).encode()).decode()
+
+    def _ticket_keyset_domain(self, cursor, keyset_order, key=None):
+        """ Domain of the tickets following the given cursor in the list, in the order of the fields (the null
+            values being last in ascending order and first in descending order, as sorted by PostgreSQL).
+            :returns the domain, or None if the cursor is invalid or made for another list than the one of `key`
+        """
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, UnicodeError, ValueError):
+            return None
+        if not isinstance(cursor, dict) or cursor.get('key') != key:
+            return None
+        values = cursor.get('values')
+        if not isinstance(values, list) or len(values) != len(keyset_order):
+            return None
+        domain = []
+        equal_domain = []
+        for (field_name, ascending), value in zip(keyset_order, values):
+            if value is None:
+                after_domain = [] if ascending else [(field_name, '!=', False)]
+            elif ascending:
+                after_domain = ['|', (field_name, '>', value), (field_name, '=', False)]
+            else:
+                after_domain = [(field_name, '<', value)]
+            if after_domain:
+                domain = OR([domain, AND([equal_domain, after_domain])])
+            equal_domain = AND([equal_domain, [(field_name, '=', value if value is not None else False)]])
+        return domain or [(0, '=', 1)]
+
+    def _ticket_keyset_pager(self, url, url_args, tickets, keyset_order, has_previous, has_next, key=None):
+        """ Pager of a list of tickets browsed with cursors: only the previous and next pages are known """
+        url_args = {key: value for key, value in url_args.items() if value}
+
+        def page(num, **cursor):
+            return {'url': '%s?%s' % (url, url_encode(dict(url_args, **cursor))), 'num': num}
+
+        current_num = 2 if has_previous else 1
+        previous_page = page(1, before=self._ticket_keyset_cursor(tickets[0], keyset_order, key)) if tickets and has_previous else page(1)
+        next_page = page(current_num + 1, after=self._ticket_keyset_cursor(tickets[-1], keyset_order, key)) if tickets and has_next else page(current_num)
+        return {
+            'page_count': current_num + (1 if has_next else 0),
+            'offset': 0,
+            'page': {'url': request.httprequest.full_path, 'num': current_num},
+            'page_first': page(1),
+            'page_start': previous_page,
+            'page_previous': previous_page,
+            'page_next': next_page,
+            'page_end': next_page,
+            'page_last': next_page,
+            'pages': [],
+        }
+
     @http.route(['/my/tickets', '/my/tickets/page/<int:page>'], type='http', auth="user", website=True)
-    def my_helpdesk_tickets(self, page=1, date_begin=None, date_end=None, sortby=None, filterby='all', search=None, groupby='none', search_in='content', **kw):
+    def my_helpdesk_tickets(self, page=1, date_begin=None, date_end=None, sortby=None, filterby='all', search=None, groupby='none', search_in='content', after=None, before=None, **kw):
         values = self._prepare_portal_layout_values()
         domain = self._prepare_helpdesk_tickets_domain()
 
+        # the sortings ending with the identifier can be browsed with cursors (see `_ticket_keyset_domain`)
         searchbar_sortings = {
-            'date': {'label': _('Newest'), 'order': 'create_date desc'},
-            'name': {'label': _('Subject'), 'order': 'name'},
+            'date': {'label': _('Newest'), 'order': 'create_date desc, id desc', 'keyset': True},
+            'name': {'label': _('Subject'), 'order': 'name, id', 'keyset': True},
             'stage': {'label': _('Stage'), 'order': 'stage_id'},
-            'reference': {'label': _('Reference'), 'order': 'id'},
-            'update': {'label': _('Last Stage Update'), 'order': 'date_last_stage_update desc'},
+            'reference': {'label': _('Reference'), 'order': 'id', 'keyset': True},
+            'update': {'label': _('Last Stage Update'), 'order': 'date_last_stage_update desc, id desc', 'keyset': True},
         }
         searchbar_filters = {
             'all': {'label': _('All'), 'domain': []},
             'assigned': {'label': _('Assigned'), 'domain': [('user_id', '!=', False)]},
             'unassigned': {'label': _('Unassigned'), 'domain': [('user_id', '=', False)]},
-            'open': {'label': _('Open'), 'domain': [('close_date', '=', False)]},
-            'closed': {'label': _('Closed'), 'domain': [('close_date', '!=', False)]},
-            'last_message_sup': {'label': _('Last message is from support')},
-            'last_message_cust': {'label': _('Last message is from customer')},
+            'open': {'label': _('Open'), 'domain': [('is_closed', '=', False)]},
+            'closed': {'label': _('Closed'), 'domain': [('is_closed', '=', True)]},
+            'last_message_sup': {'label': _('Last message is from support'), 'domain': [('last_message_author_id', '!=', False), ('last_message_is_customer', '=', False)]},
+            'last_message_cust': {'label': _('Last message is from customer'), 'domain': [('last_message_is_customer', '=', True)]},
         }
         searchbar_inputs = {
             'content': {'input': 'content', 'label': Markup(_('Search <span class="nolabel"> (in Content)</span>'))},
@@ -80,33 +169,7 @@ class CustomerPortal(portal.CustomerPortal):
             sortby = 'date'
         order = searchbar_sortings[sortby]['order']
 
-        if filterby in ['last_message_sup', 'last_message_cust']:
-            discussion_subtype_id = request.env.ref('mail.mt_comment').id
-            messages = request.env['mail.message'].search_read([('model', '=', 'helpdesk.ticket'), ('subtype_id', '=', discussion_subtype_id)], fields=['res_id', 'author_id'], order='date desc')
-            last_author_dict = {}
-            for message in messages:
-                if message['res_id'] not in last_author_dict:
-                    last_author_dict[message['res_id']] = message['author_id'][0]
-
-            ticket_author_list = request.env['helpdesk.ticket'].search_read(fields=['id', 'partner_id'])
-            ticket_author_dict = dict([(ticket_author['id'], ticket_author['partner_id'][0] if ticket_author['partner_id'] else False) for ticket_author in ticket_author_list])
-
-            last_message_cust = []
-            last_message_sup = []
-            ticket_ids = set(last_author_dict.keys()) & set(ticket_author_dict.keys())
-            for ticket_id in ticket_ids:
-                if last_author_dict[ticket_id] == ticket_author_dict[ticket_id]:
-                    last_message_cust.append(ticket_id)
-                else:
-                    last_message_sup.append(ticket_id)
-
-            if filterby == 'last_message_cust':
-                domain = AND([domain, [('id', 'in', last_message_cust)]])
-            else:
-                domain = AND([domain, [('id', 'in', last_message_sup)]])
-
-        else:
-            domain = AND([domain, searchbar_filters[filterby]['domain']])
+        domain = AND([domain, searchbar_filters[filterby]['domain']])
 
         if date_begin and date_end:
             domain = AND([domain, [('create_date', '>', date_begin), ('create_date', '<=', date_end)]])
@@ -117,27 +180,53 @@ class CustomerPortal(portal.CustomerPortal):
             if search_in in ('id', 'all'):
                 search_domain = OR([search_domain, [('id', 'ilike', search)]])
             if search_in in ('content', 'all'):
-                search_domain = OR([search_domain, ['|', ('name', 'ilike', search), ('description', 'ilike', search)]])
+                search_domain = OR([search_domain, request.env['helpdesk.ticket']._get_fulltext_domain(
+                    search, weights=SEARCH_WEIGHT_SUBJECT + SEARCH_WEIGHT_DESCRIPTION)])
             if search_in in ('customer', 'all'):
                 search_domain = OR([search_domain, [('partner_id', 'ilike', search)]])
             if search_in in ('message', 'all'):
-                discussion_subtype_id = request.env.ref('mail.mt_comment').id
-                search_domain = OR([search_domain, [('message_ids.body', 'ilike', search), ('message_ids.subtype_id', '=', discussion_subtype_id)]])
+                search_domain = OR([search_domain, request.env['helpdesk.ticket']._get_fulltext_domain(
+                    search, weights=SEARCH_WEIGHT_MESSAGE)])
             if search_in in ('status', 'all'):
                 search_domain = OR([search_domain, [('stage_id', 'ilike', search)]])
             domain = AND([domain, search_domain])
 
         # pager
-        tickets_count = request.env['helpdesk.ticket'].search_count(domain)
-        pager = portal_pager(
-            url="/my/tickets",
-            url_args={'date_begin': date_begin, 'date_end': date_end, 'sortby': sortby, 'search_in': search_in, 'search': search, 'groupby': groupby, 'filterby': filterby},
-            total=tickets_count,
-            page=page,
-            step=self._items_per_page
-        )
-
-        tickets = request.env['helpdesk.ticket'].search(domain, order=order, limit=self._items_per_page, offset=pager['offset'])
+        Ticket = request.env['helpdesk.ticket']
+        url_args = {'date_begin': date_begin, 'date_end': date_end, 'sortby': sortby, 'search_in': search_in, 'search': search, 'groupby': groupby, 'filterby': filterby}
+        cursor = after or before
+        if searchbar_sortings[sortby].get('keyset') and (cursor or page == 1):
+            # the page is an index range scan after (or before) the last (or first) ticket of the previous page
+            keyset_order = self._ticket_keyset_order(order, reverse=bool(before))
+            keyset_key = self._ticket_keyset_key(sortby, domain)
+            page_domain = domain
+            if cursor:
+                # a cursor of another sorting, filter or search starts the list again from its first page
+                cursor_domain = self._ticket_keyset_domain(cursor, keyset_order, keyset_key)
+                if cursor_domain is None:
+                    return request.redirect('/my/tickets?%s' % url_encode({key: value for key, value in url_args.items() if value}))
+                page_domain = AND([domain, cursor_domain])
+            page_order = ', '.join('%s %s' % (field_name, 'asc' if ascending else 'desc') for field_name, ascending in keyset_order)
+            tickets = Ticket.search(page_domain, order=page_order, limit=self._items_per_page + 1)
+            has_more = len(tickets) > self._items_per_page
+            tickets = tickets[:self._items_per_page]
+            if before:
+                tickets = Ticket.browse(tickets.ids[::-1])
+            pager = self._ticket_keyset_pager(
+                '/my/tickets', url_args, tickets, self._ticket_keyset_order(order),
+                has_previous=bool(after) or (bool(before) and has_more),
+                has_next=has_more or bool(before),
+                key=keyset_key,
+            )
+        else:
+            pager = portal_pager(
+                url="/my/tickets",
+                url_args=url_args,
+                total=Ticket._get_approximate_count(domain),
+                page=page,
+                step=self._items_per_page
+            )
+            tickets = Ticket.search(domain, order=order, limit=self._items_per_page, offset=pager['offset'])
         request.session['my_tickets_history'] = tickets.ids[:100]
 
         if groupby == 'stage':
@@ -178,6 +267,17 @@ class CustomerPortal(portal.CustomerPortal):
         values = self._ticket_get_page_view_values(ticket_sudo, access_token, **kw)
         return request.render("helpdesk.tickets_followup", values)
 
+    @http.route('/helpdesk/ticket/by-ref/<string:ref>', type='http', auth="user", website=True)
+    def ticket_by_ref(self, ref, **kw):
+        ticket = request.env['helpdesk.ticket'].sudo()._get_ticket_by_ref(ref)
+        if not ticket:
+            return request.redirect('/my')
+        try:
+            ticket_sudo = self._document_check_access('helpdesk.ticket', ticket.id)
+        except (AccessError, MissingError):
+            return request.redirect('/my')
+        return request.redirect('/my/ticket/%s' % ticket_sudo.id)
+
     @http.route([
         '/my/ticket/close/<int:ticket_id>',
         '/my/ticket/close/<int:ticket_id>/<access_token>',
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+
+def migrate(cr, version):
+    # the team statistics are only inserted as rows of differences, several rows per team and date
+    cr.execute("ALTER TABLE helpdesk_team_stats DROP CONSTRAINT IF EXISTS helpdesk_team_stats_team_uniq")
+    cr.execute("ALTER TABLE helpdesk_team_stats_deadline DROP CONSTRAINT IF EXISTS helpdesk_team_stats_deadline_team_date_uniq")
+    cr.execute("""
+        DELETE FROM ir_model_constraint
+         WHERE name IN ('helpdesk_team_stats_team_uniq', 'helpdesk_team_stats_deadline_team_date_uniq')
+    """)
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    # the freeze ledger of the SLA status replaces the replay of the stage tracking: initialize it once
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['helpdesk.sla.status'].search([
+        ('reached_datetime', '=', False),
+        ('sla_id.exclude_stage_ids', '!=', False),
+    ])._sla_freeze_init_from_tracking()
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+
+
+def migrate(cr, version):
+    # fill the closed flag of the tickets in one query, instead of letting the ORM compute it ticket per ticket
+    cr.execute("ALTER TABLE helpdesk_ticket ADD COLUMN IF NOT EXISTS is_closed boolean")
+    cr.execute("""
+        UPDATE helpdesk_ticket ticket
+           SET is_closed = COALESCE(stage.is_close, FALSE)
+          FROM helpdesk_stage stage
+         WHERE stage.id = ticket.stage_id
+    """)
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+
+def migrate(cr, version):
+    # fill the author of the last discussion message of the tickets in one query
+    cr.execute("""
+        ALTER TABLE helpdesk_ticket
+            ADD COLUMN IF NOT EXISTS last_message_author_id integer,
+            ADD COLUMN IF NOT EXISTS last_message_is_customer boolean
+    """)
+    cr.execute("""
+        UPDATE helpdesk_ticket ticket
+           SET last_message_author_id = message.author_id,
+               last_message_is_customer = COALESCE(message.author_id = ticket.partner_id, FALSE)
+          FROM (
+                SELECT DISTINCT ON (res_id) res_id, author_id
+                  FROM mail_message
+                 WHERE model = 'helpdesk.ticket'
+                   AND subtype_id = (SELECT res_id FROM ir_model_data WHERE module = 'mail' AND name = 'mt_comment')
+              ORDER BY res_id, date DESC, id DESC
+          ) message
+         WHERE message.res_id = ticket.id
+    """)
+    cr.execute("UPDATE helpdesk_ticket SET last_message_is_customer = FALSE WHERE last_message_is_customer IS NULL")
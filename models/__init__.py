@@ -9,3 +9,8 @@ from . import mail_template
 from . import res_users
 from . import res_partner
 from . import helpdesk_settings
+from . import resource_calendar
+from . import fcm_notification
+from . import ir_sequence
+from . import rating_rating
+from . import mail_message
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import json
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+# REMEMBER TO INSTALL oauth2client before restarting Odoo by command (pip install oauth2client)
+from oauth2client.service_account import ServiceAccountCredentials
+
+from odoo import api, fields, models
+from odoo.modules.module import get_module_resource
+
+_logger = logging.getLogger(__name__)
+
+FCM_ENDPOINT = 'https://fcm.googleapis.com/v1/projects/sigma-helpdesk/messages:send'
+FCM_CREDENTIALS_FILE = 'sigma-helpdesk-firebase-adminsdk-3ayru-601327b0dd.json'
+FCM_SCOPES = ['https://www.googleapis.com/auth/firebase.messaging']
+FCM_TIMEOUT = 10
+FCM_MAX_ATTEMPTS = 5
+
+# shared by the workers of the process: the service accounts (by key file path), their access tokens with
+# their expiry, and the pooled HTTP session
+_fcm_lock = threading.RLock()
+_fcm_credentials = {}
+_fcm_access_tokens = {}
+_fcm_session = None
+
+
+def _get_fcm_session():
+    global _fcm_session
+    with _fcm_lock:
+        if _fcm_session is None:
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+            session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+            _fcm_session = session
+        return _fcm_session
+
+
+class FcmNotification(models.Model):
+    """ Outbox of the FCM push notifications: the notifications are queued when tickets are assigned, and
+        sent by `_cron_send_notifications` outside of the transaction assigning the tickets.
+    """
+    _name = 'fcm.notification'
+    _description = 'FCM Push Notification'
+    _order = 'id'
+
+    token_id = fields.Many2one('fcm.token', string='FCM Token', required=True, ondelete='cascade', index=True)
+    user_id = fields.Many2one('res.users', string='User', related='token_id.user_id', store=True)
+    ticket_id = fields.Many2one('helpdesk.ticket', string='Ticket', ondelete='cascade')
+    title = fields.Char('Title', required=True)
+    body = fields.Char('Body')
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed')], string='Status', default='pending', required=True, index=True)
+    attempt = fields.Integer('Attempts', default=0)
+    next_attempt = fields.Datetime('Next Attempt', default=fields.Datetime.now, index=True)
+    error = fields.Text('Error')
+
+    @api.model
+    def _enqueue_ticket_assignment(self, tickets):
+        """ Queue a notification to every FCM token of the users assigned to the given tickets """
+        tickets = tickets.filtered('user_id')
+        if not tickets:
+            return self.browse()
+        tokens_by_user = defaultdict(list)
+        for token in self.env['fcm.token'].sudo().search([('user_id', 'in', tickets.user_id.ids)]):
+            tokens_by_user[token.user_id.id].append(token.id)
+        vals_list = [{
+            'token_id': token_id,
+            'ticket_id': ticket.id,
+            'title': 'New Ticket: %s' % ticket.ticket_number,
+            'body': 'A new ticket has been assigned to you.',
+        } for ticket in tickets for token_id in tokens_by_user[ticket.user_id.id]]
+        if not vals_list:
+            return self.browse()
+        notifications = self.sudo().create(vals_list)
+        cron = self.env.ref('helpdesk.ir_cron_fcm_notification', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        return notifications
+
+    @api.model
+    def _get_fcm_endpoint(self):
+        return self.env['ir.config_parameter'].sudo().get_param('helpdesk.fcm_endpoint', FCM_ENDPOINT)
+
+    @api.model
+    def _get_fcm_access_token(self):
+        """ Return the access token of the service account, fetched again only when it expires """
+        path = self.env['ir.config_parameter'].sudo().get_param('helpdesk.fcm_credentials_path') or \
+            get_module_resource('helpdesk', FCM_CREDENTIALS_FILE)
+        with _fcm_lock:
+            access_token, expiry = _fcm_access_tokens.get(path, (None, None))
+            if access_token and expiry > datetime.now():
+                return access_token
+            if path not in _fcm_credentials:
+                _fcm_credentials[path] = ServiceAccountCredentials.from_json_keyfile_name(path, FCM_SCOPES)
+            access_token_info = _fcm_credentials[path].get_access_token()
+            # keep a margin, so that no token expires while the notifications are sent
+            expires_in = max((access_token_info.expires_in or 0) - 60, 0)
+            _fcm_access_tokens[path] = (access_token_info.access_token, datetime.now() + timedelta(seconds=expires_in))
+            return access_token_info.access_token
+
+    def _get_fcm_message(self):
+        """ Message of the notifications, all queued for the same token: several notifications are merged """
+        if len(self) == 1:
+            return {'title': self.title, 'body': self.body or ''}
+        return {
+            'title': 'New Tickets: %s' % ', '.join(str(number) for number in self.ticket_id.mapped('ticket_number')),
+            'body': '%s new tickets have been assigned to you.' % len(self),
+        }
+
+    def _send_fcm(self, session, endpoint, access_token):
+        """ Send the notifications, all queued for the same token, in a single message
+            :returns a tuple (success, retry, error)
+        """
+        data = {
+            'message': {
+                'token': self.token_id.token,
+                'notification': self._get_fcm_message(),
+            },
+        }
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': 'Bearer ' + access_token,
+        }
+        try:
+            response = session.post(endpoint, headers=headers, data=json.dumps(data), timeout=FCM_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            return False, True, str(e)
+        if response.status_code == 200:
+            return True, False, False
+        # throttled or unavailable: try again later, the other errors will not be solved by waiting
+        retry = response.status_code == 429 or response.status_code >= 500
+        return False, retry, response.text
+
+    @api.model
+    def _cron_send_notifications(self, limit=1000):
+        """ Send the pending notifications, grouped per user and token, and schedule again the failed ones
+            with an exponential backoff.
+        """
+        now = fields.Datetime.now()
+        notifications = self.search([('state', '=', 'pending'), ('next_attempt', '<=', now)], limit=limit)
+        if not notifications:
+            return
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        endpoint = self._get_fcm_endpoint()
+        session = _get_fcm_session()
+        try:
+            access_token = self._get_fcm_access_token()
+        except Exception as e:
+            _logger.warning('FCM: cannot get an access token: %s', e)
+            notifications._fcm_retry(str(e))
+            return
+
+        by_user = defaultdict(lambda: defaultdict(lambda: self.browse()))
+        for notification in notifications:
+            by_user[notification.user_id][notification.token_id] |= notification
+        for user, by_token in by_user.items():
+            for token, token_notifications in by_token.items():
+                success, retry, error = token_notifications._send_fcm(session, endpoint, access_token)
+                if success:
+                    token_notifications.write({'state': 'sent', 'error': False})
+                elif retry:
+                    token_notifications._fcm_retry(error)
+                else:
+                    _logger.info('FCM: notifications %s not sent: %s', token_notifications.ids, error)
+                    token_notifications.write({'state': 'failed', 'error': error})
+            if auto_commit:
+                self.env.cr.commit()
+
+        if self.search_count([('state', '=', 'pending')]):
+            next_attempt = self.search([('state', '=', 'pending')], order='next_attempt', limit=1).next_attempt
+            cron = self.env.ref('helpdesk.ir_cron_fcm_notification', raise_if_not_found=False)
+            if cron:
+                cron.sudo()._trigger(at=max(next_attempt, now))
+
+    def _fcm_retry(self, error):
+        """ Schedule the notifications again, after 1, 2, 4, ... minutes, until they fail too many times """
+        now = fields.Datetime.now()
+        for attempt, notifications in self._grouped_by_attempt().items():
+            attempt += 1
+            if attempt >= FCM_MAX_ATTEMPTS:
+                notifications.write({'state': 'failed', 'attempt': attempt, 'error': error})
+            else:
+                notifications.write({
+                    'attempt': attempt,
+                    'next_attempt': now + timedelta(minutes=2 ** (attempt - 1)),
+                    'error': error,
+                })
+
+    def _grouped_by_attempt(self):
+        result = defaultdict(lambda: self.browse())
+        for notification in self:
+            result[notification.attempt] |= notification
+        return result
@@ -2,17 +2,32 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
 import ast
+import copy
 import datetime
+import functools
+import heapq
+import threading
+import time
 
 from dateutil import relativedelta
-from collections import defaultdict
+from collections import Counter, defaultdict, namedtuple
 from odoo import api, Command, fields, models, _
 from odoo.addons.helpdesk.models.helpdesk_ticket import TICKET_PRIORITY
+from odoo.addons.rating.models import rating as rating_model
 from odoo.addons.http_routing.models.ir_http import slug
 from odoo.addons.web.controllers.main import clean_action
 from odoo.osv import expression
 
 
+# compiled SLA policy, see `HelpdeskSLA._get_sla_index`
+SLARule = namedtuple('SLARule', ['sla_id', 'rank', 'ticket_type_id', 'stage_sequence', 'tag_mask', 'partner_paths'])
+
+# statistics of the dashboard, see `HelpdeskTeam._get_dashboard_data`:
+# {(dbname, uid, company_ids): (version, time, data)}, the version coming from `helpdesk.dashboard.version`
+DASHBOARD_CACHE_TTL = 60
+_dashboard_cache = {}
+
+
 class HelpdeskTeam(models.Model):
     _name = "helpdesk.team"
     _inherit = ['mail.alias.mixin', 'mail.thread', 'rating.parent.mixin']
@@ -61,6 +76,8 @@ class HelpdeskTeam(models.Model):
              '\tRandomly: randomly but everyone gets the same amount\n'
              '\tBalanced: to the person with the least amount of open tickets')
     member_ids = fields.Many2many('res.users', string='Team Members', domain=lambda self: self._default_domain_member_ids(), default=lambda self: self.env.user, required=True)
+    # round-robin cursor of the "randomly" assignment: number of tickets assigned by the team so far
+    assign_cursor = fields.Integer('Assignment Cursor', default=0, copy=False)
     visibility_member_ids = fields.Many2many('res.users', 'helpdesk_visibility_team', string='Team Visibility', domain=lambda self: self._default_domain_member_ids(),
         help="Team Members to whom this team will be visible. Keep empty for everyone to see this team.")
     ticket_ids = fields.One2many('helpdesk.ticket', 'team_id', string='Tickets')
@@ -90,13 +107,13 @@ class HelpdeskTeam(models.Model):
         'Public Rating', compute='_compute_portal_show_rating', store=True,
         readonly=False)
     use_sla = fields.Boolean('SLA Policies')
-    upcoming_sla_fail_tickets = fields.Integer(string='Upcoming SLA Fail Tickets', compute='_compute_upcoming_sla_fail_tickets')
-    unassigned_tickets = fields.Integer(string='Unassigned Tickets', compute='_compute_unassigned_tickets')
+    upcoming_sla_fail_tickets = fields.Integer(string='Upcoming SLA Fail Tickets', compute='_compute_team_stats')
+    unassigned_tickets = fields.Integer(string='Unassigned Tickets', compute='_compute_team_stats')
     resource_calendar_id = fields.Many2one('resource.calendar', 'Working Hours',
         default=lambda self: self.env.company.resource_calendar_id, domain="['|', ('company_id', '=', False), ('company_id', '=', company_id)]",
         help="Working hours used to determine the deadline of SLA Policies.")
-    open_ticket_count = fields.Integer("# Open Tickets", compute='_compute_open_ticket_count')
-    sla_policy_count = fields.Integer("# SLA Policy", compute='_compute_sla_policy_count')
+    open_ticket_count = fields.Integer("# Open Tickets", compute='_compute_team_stats')
+    sla_policy_count = fields.Integer("# SLA Policy", compute='_compute_team_stats')
     # auto close ticket
     auto_close_ticket = fields.Boolean('Automatic Closing')
     auto_close_day = fields.Integer('Inactive Period(days)',
@@ -133,35 +150,15 @@ class HelpdeskTeam(models.Model):
     def _compute_has_external_mail_server(self):
         self.has_external_mail_server = self.env['ir.config_parameter'].sudo().get_param('base_setup.default_external_email_server')
 
-    def _compute_upcoming_sla_fail_tickets(self):
-        ticket_data = self.env['helpdesk.ticket'].read_group([
-            ('team_id', 'in', self.ids),
-            ('sla_deadline', '!=', False),
-            ('sla_deadline', '<=', fields.Datetime.to_string((datetime.date.today() + relativedelta.relativedelta(days=1)))),
-        ], ['team_id'], ['team_id'])
-        mapped_data = dict((data['team_id'][0], data['team_id_count']) for data in ticket_data)
-        for team in self:
-            team.upcoming_sla_fail_tickets = mapped_data.get(team.id, 0)
-
-    def _compute_unassigned_tickets(self):
-        ticket_data = self.env['helpdesk.ticket'].read_group([('user_id', '=', False), ('team_id', 'in', self.ids), ('stage_id.is_close', '!=', True)], ['team_id'], ['team_id'])
-        mapped_data = dict((data['team_id'][0], data['team_id_count']) for data in ticket_data)
+    def _compute_team_stats(self):
+        # the counters of the kanban cards, all read at once from the materialized statistics of the teams
+        stats = self.env['helpdesk.team.stats'].sudo()._get_stats(self._origin.ids)
         for team in self:
-            team.unassigned_tickets = mapped_data.get(team.id, 0)
-
-    def _compute_open_ticket_count(self):
-        ticket_data = self.env['helpdesk.ticket'].read_group([
-            ('team_id', 'in', self.ids), ('stage_id.is_close', '=', False)
-        ], ['team_id'], ['team_id'])
-        mapped_data = dict((data['team_id'][0], data['team_id_count']) for data in ticket_data)
-        for team in self:
-            team.open_ticket_count = mapped_data.get(team.id, 0)
-
-    def _compute_sla_policy_count(self):
-        sla_data = self.env['helpdesk.sla'].read_group([('team_id', 'in', self.ids)], ['team_id'], ['team_id'])
-        mapped_data = dict((data['team_id'][0], data['team_id_count']) for data in sla_data)
-        for team in self:
-            team.sla_policy_count = mapped_data.get(team.id, 0)
+            team_stats = stats.get(team._origin.id, {})
+            team.open_ticket_count = team_stats.get('open_ticket_count', 0)
+            team.unassigned_tickets = team_stats.get('unassigned_ticket_count', 0)
+            team.upcoming_sla_fail_tickets = team_stats.get('upcoming_sla_fail_tickets', 0)
+            team.sla_policy_count = team_stats.get('sla_policy_count', 0)
 
     @api.depends('use_rating')
     def _compute_portal_show_rating(self):
@@ -299,99 +296,186 @@ class HelpdeskTeam(models.Model):
 
     @api.model
     def retrieve_dashboard(self):
+        result = self._get_dashboard_data()
+        result.update({
+            'helpdesk_target_closed': self.env.user.helpdesk_target_closed,
+            'helpdesk_target_rating': self.env.user.helpdesk_target_rating,
+            'helpdesk_target_success': self.env.user.helpdesk_target_success,
+        })
+        return result
+
+    @api.model
+    def _get_dashboard_data(self):
+        """ Statistics of the dashboard of the current user, cached in memory per user and companies for a few
+            seconds. The cache is only valid for the current version of the statistics of the user, the version
+            being bumped when the tickets of the user change of stage or are rated (by any worker). Loading the
+            dashboard never writes in the database, and the statistics are only cached once the transaction is
+            committed, so that they never come from a rolled back one.
+        """
+        key = (self.env.cr.dbname, self.env.uid, tuple(sorted(self.env.companies.ids)))
+        version = self.env['helpdesk.dashboard.version'].sudo()._get_version()
+        cached = _dashboard_cache.get(key)
+        if cached and cached[0] == version and time.time() - cached[1] < DASHBOARD_CACHE_TTL:
+            return copy.deepcopy(cached[2])
+        result = self._compute_dashboard_data()
+        self.env.cr.postcommit.add(functools.partial(
+            _dashboard_cache.__setitem__, key, (version, time.time(), copy.deepcopy(result))))
+        return result
+
+    @api.model
+    def _invalidate_dashboard_cache(self, user_ids=None):
+        """ Drop the cached dashboard statistics of the given users (of all of them if not given) """
+        self.env['helpdesk.dashboard.version'].sudo()._bump_version(user_ids)
+
+    @api.model
+    def _notify_dashboard(self, stats, stats_before=None):
+        """ Push the changes of the dashboard statistics of the users on the bus, so that the opened dashboards
+            apply them without reloading (see `helpdesk.ticket._get_dashboard_stats`). The changes are pushed per
+            company of the tickets, the dashboards only applying the ones of the companies they show.
+            :param stats: dict (user_id, company_id) -> Counter (section, key) -> value after the change
+            :param stats_before: same dict, before the change
+        """
+        changes = defaultdict(Counter)
+        for key, key_stats in stats.items():
+            changes[key].update(key_stats)
+        for key, key_stats in (stats_before or {}).items():
+            changes[key].subtract(key_stats)
+        changes = {key: key_changes for key, key_changes in changes.items() if any(key_changes.values())}
+        users = self.env['res.users'].sudo().browse(list({user_id for user_id, company_id in changes}))
+        partner_per_user = {user.id: user.partner_id for user in users}
+        notifications = []
+        for (user_id, company_id), key_changes in sorted(changes.items()):
+            payload = defaultdict(dict)
+            for (section, key), value in key_changes.items():
+                if value:
+                    payload[section][key] = value
+            notifications.append((partner_per_user[user_id], 'helpdesk.dashboard/update', {
+                'company_id': company_id,
+                'changes': payload,
+            }))
+        if notifications:
+            self.env['bus.bus']._sendmany(notifications)
+
+    @api.model
+    def _compute_dashboard_data(self):
         domain = [('user_id', '=', self.env.uid)]
-        group_fields = ['priority', 'create_date', 'stage_id', 'close_hours']
-        list_fields = ['priority', 'create_date', 'stage_id', 'close_hours']
-        #TODO: remove SLA calculations if user_uses_sla is false.
         user_uses_sla = self.user_has_groups('helpdesk.group_use_sla') and\
             bool(self.env['helpdesk.team'].search([('use_sla', '=', True)], limit=1))
 
-        if user_uses_sla:
-            group_fields.insert(1, 'sla_deadline:year')
-            group_fields.insert(2, 'sla_deadline:hour')
-            group_fields.insert(3, 'sla_reached_late')
-            list_fields.insert(1, 'sla_deadline')
-            list_fields.insert(2, 'sla_reached_late')
-
         HelpdeskTicket = self.env['helpdesk.ticket']
-        tickets = HelpdeskTicket.search_read(expression.AND([domain, [('stage_id.is_close', '=', False)]]), ['sla_deadline', 'open_hours', 'sla_reached_late', 'priority'])
-
+        rating_enable = bool(self.env['helpdesk.team'].search([('use_rating', '=', True)], limit=1))
         result = {
-            'helpdesk_target_closed': self.env.user.helpdesk_target_closed,
-            'helpdesk_target_rating': self.env.user.helpdesk_target_rating,
-            'helpdesk_target_success': self.env.user.helpdesk_target_success,
             'today': {'count': 0, 'rating': 0, 'success': 0},
             '7days': {'count': 0, 'rating': 0, 'success': 0},
             'my_all': {'count': 0, 'hours': 0, 'failed': 0},
             'my_high': {'count': 0, 'hours': 0, 'failed': 0},
             'my_urgent': {'count': 0, 'hours': 0, 'failed': 0},
             'show_demo': not bool(HelpdeskTicket.search([], limit=1)),
-            'rating_enable': False,
+            'rating_enable': rating_enable,
             'success_rate_enable': user_uses_sla
         }
 
-        def _is_sla_failed(data):
-            deadline = data.get('sla_deadline')
-            sla_deadline = fields.Datetime.now() > deadline if deadline else False
-            return sla_deadline or data.get('sla_reached_late')
-
-        def add_to(ticket, key="my_all"):
-            result[key]['count'] += 1
-            result[key]['hours'] += ticket['open_hours']
-            if _is_sla_failed(ticket):
-                result[key]['failed'] += 1
-
-        for ticket in tickets:
-            add_to(ticket, 'my_all')
-            if ticket['priority'] == '2':
-                add_to(ticket, 'my_high')
-            if ticket['priority'] == '3':
-                add_to(ticket, 'my_urgent')
-
-        dt = fields.Date.context_today(self)
-        tickets = HelpdeskTicket.read_group(domain + [('stage_id.is_close', '=', True), ('close_date', '>=', dt)], list_fields, group_fields, lazy=False)
-        for ticket in tickets:
-            result['today']['count'] += ticket['__count']
-            if not _is_sla_failed(ticket):
-                result['today']['success'] += ticket['__count']
-
-        dt = fields.Datetime.to_string((datetime.date.today() - relativedelta.relativedelta(days=6)))
-        tickets = HelpdeskTicket.read_group(domain + [('stage_id.is_close', '=', True), ('close_date', '>=', dt)], list_fields, group_fields, lazy=False)
-        for ticket in tickets:
-            result['7days']['count'] += ticket['__count']
-            if not _is_sla_failed(ticket):
-                result['7days']['success'] += ticket['__count']
-
-        result['today']['success'] = fields.Float.round(result['today']['success'] * 100 / (result['today']['count'] or 1), 2)
-        result['7days']['success'] = fields.Float.round(result['7days']['success'] * 100 / (result['7days']['count'] or 1), 2)
-        result['my_all']['hours'] = fields.Float.round(result['my_all']['hours'] / (result['my_all']['count'] or 1), 2)
-        result['my_high']['hours'] = fields.Float.round(result['my_high']['hours'] / (result['my_high']['count'] or 1), 2)
-        result['my_urgent']['hours'] = fields.Float.round(result['my_urgent']['hours'] / (result['my_urgent']['count'] or 1), 2)
-
-        if self.env['helpdesk.team'].search([('use_rating', '=', True)], limit=1):
-            result['rating_enable'] = True
-            # rating of today
-            domain = [('user_id', '=', self.env.uid)]
-            dt = fields.Date.today()
-            tickets = self.env['helpdesk.ticket'].search(domain + [('stage_id.is_close', '=', True), ('close_date', '>=', dt)])
-            activity = tickets.rating_get_grades()
-            total_rating = self._compute_activity_avg(activity)
-            total_activity_values = sum(activity.values())
-            # In the 2 formula's below, we need to multiply at the end by (100 / MAX_SCORING)
-            # where MAX_SCORING is defined in _compute_activity_avg as the value for a "great" rating.
-            team_satisfaction = fields.Float.round((total_rating / total_activity_values if total_activity_values else 0), 2) * 20
-            if team_satisfaction:
-                result['today']['rating'] = team_satisfaction
-
-            # rating of last 7 days (6 days + today)
-            dt = fields.Datetime.to_string((datetime.date.today() - relativedelta.relativedelta(days=6)))
-            tickets = self.env['helpdesk.ticket'].search(domain + [('stage_id.is_close', '=', True), ('close_date', '>=', dt)])
-            activity = tickets.rating_get_grades()
-            total_rating = self._compute_activity_avg(activity)
-            total_activity_values = sum(activity.values())
-            team_satisfaction_7days = fields.Float.round((total_rating / total_activity_values if total_activity_values else 0), 2) * 20
-            if team_satisfaction_7days:
-                result['7days']['rating'] = team_satisfaction_7days
+        # open tickets per priority, closed tickets of today and of the last 7 days with their success rate
+        # (closed without reaching an SLA late: the passed deadlines of the SLA not reached are ignored), and
+        # their ratings: all aggregated in a single query on the tickets of the user (access rules included)
+        HelpdeskTicket.flush(['user_id', 'stage_id', 'is_closed', 'priority', 'create_date', 'close_date', 'sla_deadline', 'sla_reached_late', 'active'])
+        self.env['rating.rating'].flush(['res_model', 'res_id', 'rating', 'consumed'])
+        query = HelpdeskTicket._where_calc(domain)
+        HelpdeskTicket._apply_ir_rules(query, 'read')
+        ticket_query, ticket_params = query.subselect()
+        self.env.cr.execute("""
+            WITH params AS (
+                SELECT %s::timestamp AS now,
+                       %s::date AS today,
+                       %s::date AS seven_days,
+                       %s AS use_sla,
+                       %s AS rating_enable,
+                       %s::date AS rating_today,
+                       %s::date AS rating_seven_days,
+                       %s AS rating_satisfied,
+                       %s AS rating_ok
+            ), ticket AS (
+                SELECT ticket.id,
+                       ticket.priority,
+                       ticket.close_date,
+                       ticket.stage_id IS NOT NULL AND NOT COALESCE(ticket.is_closed, FALSE) AS is_open,
+                       COALESCE(ticket.is_closed, FALSE) AS is_closed,
+                       COALESCE(ticket.sla_deadline < params.now OR ticket.sla_reached_late, FALSE) AS is_failed,
+                       COALESCE(ticket.sla_reached_late, FALSE) AS is_reached_late,
+                       TRUNC(EXTRACT(EPOCH FROM COALESCE(ticket.close_date, params.now) - ticket.create_date) / 3600) AS open_hours
+                  FROM helpdesk_ticket ticket, params
+                 WHERE ticket.id IN ({ticket_query})
+            ), rating AS (
+                SELECT rating.res_id,
+                       COUNT(*) FILTER (WHERE rating.rating >= params.rating_satisfied) AS great,
+                       COUNT(*) FILTER (WHERE rating.rating < params.rating_satisfied AND rating.rating >= params.rating_ok) AS okay,
+                       COUNT(*) FILTER (WHERE rating.rating < params.rating_ok) AS bad
+                  FROM rating_rating rating, params
+                 WHERE params.rating_enable
+                   AND rating.res_model = 'helpdesk.ticket'
+                   AND rating.res_id IN (SELECT id FROM ticket WHERE is_closed AND close_date >= params.rating_seven_days)
+                   AND rating.consumed
+                   AND rating.rating >= 1
+              GROUP BY rating.res_id
+            )
+            SELECT COUNT(*) FILTER (WHERE is_open) AS my_all_count,
+                   COALESCE(SUM(open_hours) FILTER (WHERE is_open), 0) AS my_all_hours,
+                   COUNT(*) FILTER (WHERE is_open AND is_failed) AS my_all_failed,
+                   COUNT(*) FILTER (WHERE is_open AND priority = '2') AS my_high_count,
+                   COALESCE(SUM(open_hours) FILTER (WHERE is_open AND priority = '2'), 0) AS my_high_hours,
+                   COUNT(*) FILTER (WHERE is_open AND is_failed AND priority = '2') AS my_high_failed,
+                   COUNT(*) FILTER (WHERE is_open AND priority = '3') AS my_urgent_count,
+                   COALESCE(SUM(open_hours) FILTER (WHERE is_open AND priority = '3'), 0) AS my_urgent_hours,
+                   COUNT(*) FILTER (WHERE is_open AND is_failed AND priority = '3') AS my_urgent_failed,
+                   COUNT(*) FILTER (WHERE is_closed AND close_date >= params.today) AS today_count,
+                   COUNT(*) FILTER (WHERE is_closed AND close_date >= params.seven_days) AS seven_days_count,
+                   COUNT(*) FILTER (WHERE is_closed AND close_date >= params.today AND params.use_sla AND is_reached_late) AS today_failed,
+                   COUNT(*) FILTER (WHERE is_closed AND close_date >= params.seven_days AND params.use_sla AND is_reached_late) AS seven_days_failed,
+                   COALESCE(SUM(rating.great) FILTER (WHERE close_date >= params.rating_today), 0) AS today_great,
+                   COALESCE(SUM(rating.okay) FILTER (WHERE close_date >= params.rating_today), 0) AS today_okay,
+                   COALESCE(SUM(rating.bad) FILTER (WHERE close_date >= params.rating_today), 0) AS today_bad,
+                   COALESCE(SUM(rating.great), 0) AS seven_days_great,
+                   COALESCE(SUM(rating.okay), 0) AS seven_days_okay,
+                   COALESCE(SUM(rating.bad), 0) AS seven_days_bad
+              FROM ticket
+        CROSS JOIN params
+         LEFT JOIN rating ON rating.res_id = ticket.id
+        """.format(ticket_query=ticket_query), [
+            fields.Datetime.now(),
+            fields.Date.context_today(self),
+            datetime.date.today() - relativedelta.relativedelta(days=6),
+            user_uses_sla,
+            rating_enable,
+            fields.Date.today(),
+            datetime.date.today() - relativedelta.relativedelta(days=6),
+            rating_model.RATING_LIMIT_SATISFIED,
+            rating_model.RATING_LIMIT_OK,
+        ] + list(ticket_params))
+        data = self.env.cr.dictfetchone()
+
+        for key in ['my_all', 'my_high', 'my_urgent']:
+            result[key]['count'] = data['%s_count' % key]
+            result[key]['failed'] = data['%s_failed' % key]
+            result[key]['hours'] = fields.Float.round(float(data['%s_hours' % key]) / (data['%s_count' % key] or 1), 2)
+            # the totals are kept, to apply the changes pushed by `_notify_dashboard`
+            result[key]['hours_total'] = float(data['%s_hours' % key])
+        for key, prefix in [('today', 'today'), ('7days', 'seven_days')]:
+            count = data['%s_count' % prefix]
+            result[key]['count'] = count
+            result[key]['failed'] = data['%s_failed' % prefix]
+            result[key]['success'] = fields.Float.round((count - data['%s_failed' % prefix]) * 100 / (count or 1), 2)
+
+        if rating_enable:
+            for key, prefix in [('today', 'today'), ('7days', 'seven_days')]:
+                activity = {grade: int(data['%s_%s' % (prefix, grade)]) for grade in ['great', 'okay', 'bad']}
+                result[key].update(activity)
+                total_rating = self._compute_activity_avg(activity)
+                total_activity_values = sum(activity.values())
+                # In the formula below, we need to multiply at the end by (100 / MAX_SCORING)
+                # where MAX_SCORING is defined in _compute_activity_avg as the value for a "great" rating.
+                team_satisfaction = fields.Float.round((total_rating / total_activity_values if total_activity_values else 0), 2) * 20
+                if team_satisfaction:
+                    result[key]['rating'] = team_satisfaction
         return result
 
     def _action_view_rating(self, period=False, only_my_closed=False):
@@ -407,7 +491,7 @@ class HelpdeskTeam(models.Model):
             domain += [('close_date', '>=', fields.Datetime.to_string(datetime.date.today()))]
 
         if only_my_closed:
-            domain += [('user_id', '=', self._uid), ('stage_id.is_close', '=', True)]
+            domain += [('user_id', '=', self._uid), ('is_closed', '=', True)]
 
         ticket_ids = self.env['helpdesk.ticket'].search(domain).ids
         action = self.env["ir.actions.actions"]._for_xml_id("helpdesk.rating_rating_action_helpdesk")
@@ -450,7 +534,7 @@ class HelpdeskTeam(models.Model):
         action = self.action_view_ticket()
         action.update({
             'display_name': _("Tickets"),
-            'domain': [('team_id', '=', self.id), ('stage_id.is_close', '=', False)],
+            'domain': [('team_id', '=', self.id), ('is_closed', '=', False)],
         })
         return action
 
@@ -481,25 +565,71 @@ class HelpdeskTeam(models.Model):
         return great + okey + bad
 
     def _determine_user_to_assign(self):
-        """ Get a dict with the user (per team) that should be assign to the nearly created ticket according to the team policy
+        """ Get a dict with the user (per team) that should be assign to the nearly created ticket according to the team policy.
+            The round-robin cursor of the teams is not advanced: use `_assign_users` to reserve the users of new tickets.
             :returns a mapping of team identifier with the "to assign" user (maybe an empty record).
             :rtype : dict (key=team_id, value=record of res.users)
         """
         result = dict.fromkeys(self.ids, self.env['res.users'])
+        team_loads = self.env['helpdesk.team.load']._get_load(self.filtered(lambda team: team.assign_method == 'balanced').ids)
         for team in self:
             member_ids = sorted(team.member_ids.ids)
+            if not member_ids:
+                continue
             if team.assign_method == 'randomly':  # randomly means new tickets get uniformly distributed
-                last_assigned_user = self.env['helpdesk.ticket'].search([('team_id', '=', team.id)], order='create_date desc, id desc', limit=1).user_id
-                index = 0
-                if last_assigned_user and last_assigned_user.id in member_ids:
-                    previous_index = member_ids.index(last_assigned_user.id)
-                    index = (previous_index + 1) % len(member_ids)
-                result[team.id] = self.env['res.users'].browse(member_ids[index])
+                result[team.id] = self.env['res.users'].browse(member_ids[team.assign_cursor % len(member_ids)])
             elif team.assign_method == 'balanced':  # find the member with the least open ticket
-                ticket_count_data = self.env['helpdesk.ticket'].read_group([('stage_id.is_close', '=', False), ('user_id', 'in', member_ids), ('team_id', '=', team.id)], ['user_id'], ['user_id'])
-                open_ticket_per_user_map = dict.fromkeys(member_ids, 0)  # dict: user_id -> open ticket count
-                open_ticket_per_user_map.update((item['user_id'][0], item['user_id_count']) for item in ticket_count_data)
-                result[team.id] = self.env['res.users'].browse(min(open_ticket_per_user_map, key=open_ticket_per_user_map.get))
+                open_ticket_per_user_map = team_loads.get(team.id, {})  # dict: user_id -> open ticket count
+                result[team.id] = self.env['res.users'].browse(min(member_ids, key=lambda user_id: open_ticket_per_user_map.get(user_id, 0)))
+        return result
+
+    def _assign_users(self, ticket_counts):
+        """ Reserve the users to assign to new tickets according to the team policy. The round-robin cursor of the
+            "randomly" teams is advanced atomically by the number of tickets, so that concurrent transactions never
+            get the same users.
+            :param ticket_counts: mapping of team identifier with the number of tickets to assign
+            :returns a mapping of team identifier with the list of users (maybe empty records), one per ticket
+            :rtype : dict (key=team_id, value=list of res.users records)
+        """
+        result = {}
+        randomly_teams = self.filtered(lambda team: team.assign_method == 'randomly' and team.member_ids)
+        if randomly_teams:
+            randomly_teams.flush(['assign_cursor'])
+        for team in randomly_teams:
+            count = ticket_counts.get(team.id, 0)
+            if not count:
+                result[team.id] = []
+                continue
+            self.env.cr.execute("""
+                UPDATE helpdesk_team
+                   SET assign_cursor = COALESCE(assign_cursor, 0) + %s
+                 WHERE id = %s
+             RETURNING assign_cursor
+            """, (count, team.id))
+            cursor = self.env.cr.fetchone()[0] - count
+            member_ids = sorted(team.member_ids.ids)
+            result[team.id] = [
+                self.env['res.users'].browse(member_ids[(cursor + index) % len(member_ids)])
+                for index in range(count)
+            ]
+        randomly_teams.invalidate_cache(['assign_cursor'], randomly_teams.ids)
+
+        # spread the tickets among the least loaded members: the open ticket counts are updated as tickets are given
+        balanced_teams = self.filtered(lambda team: team.assign_method == 'balanced' and team.member_ids)
+        team_loads = self.env['helpdesk.team.load']._get_load(balanced_teams.ids)
+        for team in balanced_teams:
+            open_ticket_per_user_map = team_loads.get(team.id, {})
+            heap = [(open_ticket_per_user_map.get(user_id, 0), user_id) for user_id in sorted(team.member_ids.ids)]
+            heapq.heapify(heap)
+            users = []
+            for dummy in range(ticket_counts.get(team.id, 0)):
+                count, user_id = heap[0]
+                heapq.heapreplace(heap, (count + 1, user_id))
+                users.append(self.env['res.users'].browse(user_id))
+            result[team.id] = users
+
+        for team in self - randomly_teams - balanced_teams:
+            result[team.id] = [self.env['res.users']] * ticket_counts.get(team.id, 0)
         return result
 
     def _determine_stage(self):
@@ -521,41 +651,64 @@ class HelpdeskTeam(models.Model):
             closed_stage = self.stage_ids[-1]
         return closed_stage
 
-    def _cron_auto_close_tickets(self):
-        teams = self.env['helpdesk.team'].search_read(
-            domain=[
-                ('auto_close_ticket', '=', True),
-                ('auto_close_day', '>', 0),
-                ('to_stage_id', '!=', False)],
-            fields=[
-                'id',
-                'auto_close_day',
-                'from_stage_ids',
-                'to_stage_id']
-        )
-        teams_dict = defaultdict(dict)  # key: team_id, values: the remaining result of the search_group
-        today = fields.datetime.today()
-        for team in teams:
-            # Compute the threshold_date
-            team['threshold_date'] = today - relativedelta.relativedelta(days=team['auto_close_day'])
-            teams_dict[team['id']] = team
-        tickets_domain = [('stage_id.is_close', '=', False), ('team_id', 'in', list(teams_dict.keys()))]
-        tickets = self.env['helpdesk.ticket'].search(tickets_domain)
-
-        def is_inactive_ticket(ticket):
-            team = teams_dict[ticket.team_id.id]
-            is_write_date_ok = ticket.write_date <= team['threshold_date']
-            if team['from_stage_ids']:
-                is_stage_ok = ticket.stage_id.id in team['from_stage_ids']
-            else:
-                is_stage_ok = not ticket.stage_id.is_close
-            return is_write_date_ok and is_stage_ok
+    def _get_auto_close_ticket_data(self, last_ticket_id, limit):
+        """ Find the next inactive tickets of the teams closing their tickets automatically, after the given ticket:
+            their last update is older than the inactive period of their team, and they are in one of the stages
+            to close of their team (or in any open stage if none is given).
+            :returns a list of (ticket_id, to_stage_id), ordered by ticket
+        """
+        self.env['helpdesk.ticket'].flush(['team_id', 'stage_id', 'is_closed', 'active', 'write_date'])
+        self.flush(['auto_close_ticket', 'auto_close_day', 'to_stage_id', 'from_stage_ids'])
+        self.env.cr.execute("""
+            SELECT ticket.id, team.to_stage_id
+              FROM helpdesk_ticket ticket
+              JOIN helpdesk_team team ON team.id = ticket.team_id
+             WHERE team.auto_close_ticket
+               AND team.auto_close_day > 0
+               AND team.to_stage_id IS NOT NULL
+               AND ticket.active
+               AND ticket.stage_id IS NOT NULL
+               AND NOT COALESCE(ticket.is_closed, FALSE)
+               AND ticket.write_date <= %(now)s - team.auto_close_day * interval '1 day'
+               AND (
+                    ticket.stage_id IN (SELECT helpdesk_stage_id FROM team_stage_auto_close_from_rel WHERE helpdesk_team_id = team.id)
+                    OR NOT EXISTS (SELECT 1 FROM team_stage_auto_close_from_rel WHERE helpdesk_team_id = team.id)
+               )
+               AND ticket.id > %(last_ticket_id)s
+          ORDER BY ticket.id
+             LIMIT %(limit)s
+        """, {
+            'now': fields.Datetime.now(),
+            'last_ticket_id': last_ticket_id,
+            'limit': limit,
+        })
+        return self.env.cr.fetchall()
 
-        inactive_tickets = tickets.filtered(is_inactive_ticket)
-        for ticket in inactive_tickets:
-            # to_stage_id is mandatory in the view but not in the model so it is better to test it.
-            if teams_dict[ticket.team_id.id]['to_stage_id']:
-                ticket.write({'stage_id': teams_dict[ticket.team_id.id]['to_stage_id'][0]})
+    def _cron_auto_close_tickets(self, chunk_size=1000):
+        """ Move the inactive tickets to the closing stage of their team, by chunks of `chunk_size` tickets. The
+            work is committed after each chunk, with the last processed ticket, so that an interrupted run resumes
+            where it stopped.
+        """
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        ICP = self.env['ir.config_parameter'].sudo()
+        last_ticket_id = int(ICP.get_param('helpdesk.auto_close_last_ticket_id', 0))
+        while True:
+            ticket_data = self._get_auto_close_ticket_data(last_ticket_id, chunk_size)
+            if not ticket_data:
+                break
+            ticket_ids_per_stage = defaultdict(list)
+            for ticket_id, to_stage_id in ticket_data:
+                ticket_ids_per_stage[to_stage_id].append(ticket_id)
+            for to_stage_id, ticket_ids in ticket_ids_per_stage.items():
+                self.env['helpdesk.ticket'].browse(ticket_ids).write({'stage_id': to_stage_id})
+            last_ticket_id = ticket_data[-1][0]
+            ICP.set_param('helpdesk.auto_close_last_ticket_id', last_ticket_id)
+            if auto_commit:
+                self.env.cr.commit()
+            # free the memory of the processed tickets
+            self.env['helpdesk.ticket'].invalidate_cache()
+        # the run is over: the next one starts from the first ticket
+        ICP.set_param('helpdesk.auto_close_last_ticket_id', 0)
 
     def action_view_helpdesk_rating(self):
         action = self.env['ir.actions.act_window']._for_xml_id('helpdesk.rating_rating_action_helpdesk')
@@ -636,6 +789,39 @@ class HelpdeskStage(models.Model):
     def write(self, vals):
         if 'active' in vals and not vals['active']:
             self.env['helpdesk.ticket'].search([('stage_id', 'in', self.ids)]).write({'active': False})
+        if 'sequence' in vals or 'active' in vals:
+            self.env['helpdesk.sla']._invalidate_sla_index()
+        if 'is_close' in vals:
+            # the open tickets of the stages become closed, or the opposite
+            flipped_stages = self.filtered(lambda stage: stage.is_close != bool(vals['is_close']))
+            if flipped_stages:
+                ticket_count_data = self.env['helpdesk.ticket'].sudo().read_group(
+                    [('stage_id', 'in', flipped_stages.ids), ('team_id', '!=', False)],
+                    ['team_id', 'user_id'], ['team_id', 'user_id'], lazy=False)
+                sign = -1 if vals['is_close'] else 1
+                load = Counter()
+                stats = Counter()
+                for item in ticket_count_data:
+                    team_id = item['team_id'][0]
+                    stats[(team_id, 'open_ticket_count', False)] += item['__count'] * sign
+                    if item['user_id']:
+                        load[(team_id, item['user_id'][0])] += item['__count'] * sign
+                    else:
+                        stats[(team_id, 'unassigned_ticket_count', False)] += item['__count'] * sign
+                self.env['helpdesk.team.load']._update_load(load)
+                self.env['helpdesk.team.stats'].sudo()._update_stats(stats)
+                # the assigned tickets of the stages move between the open and the closed ones of the dashboards
+                dashboard_tickets = self.env['helpdesk.ticket'].sudo().search(
+                    [('stage_id', 'in', flipped_stages.ids), ('user_id', '!=', False)])
+                dashboard_before = dashboard_tickets._get_dashboard_stats()
+                # one query for all the tickets of the stages, instead of recomputing them one by one
+                self.env['helpdesk.ticket'].flush(['stage_id', 'is_closed'])
+                self.env.cr.execute(
+                    "UPDATE helpdesk_ticket SET is_closed = %s WHERE stage_id IN %s",
+                    (bool(vals['is_close']), tuple(flipped_stages.ids)))
+                self.env['helpdesk.ticket'].invalidate_cache(['is_closed'])
+                self.env['helpdesk.team']._invalidate_dashboard_cache(set(dashboard_tickets.user_id.ids))
+                self.env['helpdesk.team']._notify_dashboard(dashboard_tickets._get_dashboard_stats(), dashboard_before)
         return super(HelpdeskStage, self).write(vals)
 
     def unlink(self):
@@ -694,9 +880,70 @@ class HelpdeskSLA(models.Model):
     time = fields.Float('In', help='Time to reach given stage based on ticket creation date', default=0, required=True)
     ticket_count = fields.Integer(compute='_compute_ticket_count')
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        self._invalidate_sla_index()
+        slas = super(HelpdeskSLA, self).create(vals_list)
+        self.env['helpdesk.team.stats'].sudo()._update_stats(slas._get_team_stats())
+        return slas
+
+    def write(self, vals):
+        self._invalidate_sla_index()
+        update_stats = 'team_id' in vals or 'active' in vals
+        if update_stats:
+            stats_before = self._get_team_stats()
+        res = super(HelpdeskSLA, self).write(vals)
+        if update_stats:
+            self.env['helpdesk.team.stats'].sudo()._update_stats(self._get_team_stats(), stats_before)
+        return res
+
+    def unlink(self):
+        self._invalidate_sla_index()
+        self.env['helpdesk.team.stats'].sudo()._update_stats({}, self._get_team_stats())
+        return super(HelpdeskSLA, self).unlink()
+
+    def _get_team_stats(self):
+        """ Count the active SLA policies in the statistics of their team, see `helpdesk.team.stats` """
+        return Counter((sla.team_id.id, 'sla_policy_count', False) for sla in self if sla.active and sla.team_id)
+
+    @api.model
+    def _invalidate_sla_index(self):
+        self.env.cr.cache.pop('helpdesk_sla_index', None)
+
+    @api.model
+    def _get_sla_index(self, team_ids):
+        """ Get the in-memory index of the active SLA policies of the given teams. The index is built once
+            per transaction (and invalidated when a policy changes), so that matching tickets against the
+            policies does not need any query.
+            :returns a mapping of team identifier with its rules grouped by minimum priority
+            :rtype : dict (key=team_id, value=dict (key=priority, value=list of SLARule))
+        """
+        cache = self.env.cr.cache.get('helpdesk_sla_index')
+        if cache is None:
+            cache = self.env.cr.cache['helpdesk_sla_index'] = {}
+            # the policies may change in another transaction
+            self.env.cr.postcommit.add(self._invalidate_sla_index)
+            self.env.cr.postrollback.add(self._invalidate_sla_index)
+
+        missing_team_ids = [team_id for team_id in team_ids if team_id not in cache]
+        if missing_team_ids:
+            for team_id in missing_team_ids:
+                cache[team_id] = defaultdict(list)
+            slas = self.sudo().search([('team_id', 'in', missing_team_ids)])
+            for rank, sla in enumerate(slas):
+                cache[sla.team_id.id][sla.priority].append(SLARule(
+                    sla_id=sla.id,
+                    rank=rank,
+                    ticket_type_id=sla.ticket_type_id.id,
+                    stage_sequence=sla.stage_id.sequence if sla.stage_id else None,
+                    tag_mask=sum(1 << tag_id for tag_id in sla.tag_ids.ids),
+                    partner_paths=tuple(sla.partner_ids.mapped('parent_path')),
+                ))
+        return {team_id: cache[team_id] for team_id in team_ids}
+
     def _compute_ticket_count(self):
         res = self.env['helpdesk.ticket'].read_group(
-            [('sla_ids', 'in', self.ids), ('stage_id.is_close', '=', False)],
+            [('sla_ids', 'in', self.ids), ('is_closed', '=', False)],
             ['sla_ids'], ['sla_ids'])
         sla_data = {r['sla_ids']: r['sla_ids_count'] for r in res}
         for sla in self:
@@ -713,3 +960,281 @@ class HelpdeskSLA(models.Model):
             },
         })
         return action
+
+
+class HelpdeskTeamLoad(models.Model):
+    """ Number of open tickets assigned to each member of the teams, used by the "balanced" assignment. Kept up to
+        date by the tickets (create, write, unlink) and by the stages becoming closed or open.
+    """
+    _name = 'helpdesk.team.load'
+    _description = 'Helpdesk Team Member Load'
+
+    team_id = fields.Many2one('helpdesk.team', string='Team', required=True, ondelete='cascade', index=True)
+    user_id = fields.Many2one('res.users', string='User', required=True, ondelete='cascade')
+    open_ticket_count = fields.Integer('Open Tickets', default=0)
+
+    _sql_constraints = [
+        ('team_user_uniq', 'unique(team_id, user_id)', 'The load of a team member must be unique.'),
+    ]
+
+    @api.model
+    def _get_load(self, team_ids):
+        """ :returns a mapping of team identifier with a dict (user_id -> open ticket count) """
+        result = defaultdict(dict)
+        if not team_ids:
+            return result
+        self.flush(['team_id', 'user_id', 'open_ticket_count'])
+        self.env.cr.execute("""
+            SELECT team_id, user_id, open_ticket_count
+              FROM helpdesk_team_load
+             WHERE team_id IN %s
+        """, (tuple(team_ids),))
+        for team_id, user_id, count in self.env.cr.fetchall():
+            result[team_id][user_id] = count
+        return result
+
+    @api.model
+    def _update_load(self, added, removed=None):
+        """ Add the open tickets counted in `added` to the load, and remove the ones counted in `removed`
+            :param added: mapping of (team_id, user_id) with a number of open tickets
+            :param removed: idem, substracted from the load
+        """
+        load = Counter(added)
+        load.subtract(removed or {})
+        # sorted, so that concurrent updates lock the rows in the same order and do not deadlock
+        values = sorted((team_id, user_id, count) for (team_id, user_id), count in load.items() if count)
+        if not values:
+            return
+        self.flush(['open_ticket_count'])
+        self.env.cr.execute("""
+            INSERT INTO helpdesk_team_load (team_id, user_id, open_ticket_count)
+                 VALUES %s
+            ON CONFLICT (team_id, user_id)
+              DO UPDATE SET open_ticket_count = helpdesk_team_load.open_ticket_count + EXCLUDED.open_ticket_count
+        """ % ', '.join(['%s'] * len(values)), values)
+        self.invalidate_cache(['open_ticket_count'])
+
+    @api.model
+    def _rebuild(self):
+        """ Count again the open tickets of all the team members """
+        self.env['helpdesk.ticket'].flush(['team_id', 'user_id', 'stage_id', 'is_closed', 'active'])
+        self.env.cr.execute("DELETE FROM helpdesk_team_load")
+        self.env.cr.execute("""
+            INSERT INTO helpdesk_team_load (team_id, user_id, open_ticket_count)
+                 SELECT T.team_id, T.user_id, COUNT(*)
+                   FROM helpdesk_ticket T
+                  WHERE T.active AND T.stage_id IS NOT NULL AND NOT COALESCE(T.is_closed, FALSE)
+                    AND T.team_id IS NOT NULL AND T.user_id IS NOT NULL
+               GROUP BY T.team_id, T.user_id
+        """)
+        self.invalidate_cache()
+
+
+class HelpdeskTeamStats(models.Model):
+    """ Counters shown on the kanban cards of the teams: their open and unassigned tickets and their SLA policies.
+        The tickets with an SLA deadline are counted per day in `helpdesk.team.stats.deadline`, to get the ones
+        failing their SLA soon. Kept up to date by the tickets (create, write, unlink), the stages becoming closed
+        or open and the SLA policies, and rebuilt from scratch every day to fix any drift (e.g. the deadlines
+        moved by a change of the SLA policies).
+        The changes are only inserted as rows of differences, summed when read, so that the concurrent writes of
+        the tickets of a team never update the same rows; the rows are merged together every hour.
+    """
+    _name = 'helpdesk.team.stats'
+    _description = 'Helpdesk Team Statistics'
+
+    team_id = fields.Many2one('helpdesk.team', string='Team', required=True, index=True, ondelete='cascade')
+    open_ticket_count = fields.Integer('Open Tickets', default=0)
+    unassigned_ticket_count = fields.Integer('Unassigned Tickets', default=0)
+    sla_policy_count = fields.Integer('SLA Policies', default=0)
+
+    @api.model
+    def _get_stats(self, team_ids):
+        """ :returns a mapping of team identifier with a dict of its counters, 'upcoming_sla_fail_tickets' being
+            the number of tickets with an SLA deadline before tomorrow
+        """
+        if not team_ids:
+            return {}
+        self.flush()
+        self.env['helpdesk.team.stats.deadline'].flush()
+        self.env.cr.execute("""
+            SELECT team.id,
+                   COALESCE((SELECT SUM(stats.open_ticket_count)
+                               FROM helpdesk_team_stats stats
+                              WHERE stats.team_id = team.id), 0) AS open_ticket_count,
+                   COALESCE((SELECT SUM(stats.unassigned_ticket_count)
+                               FROM helpdesk_team_stats stats
+                              WHERE stats.team_id = team.id), 0) AS unassigned_ticket_count,
+                   COALESCE((SELECT SUM(stats.sla_policy_count)
+                               FROM helpdesk_team_stats stats
+                              WHERE stats.team_id = team.id), 0) AS sla_policy_count,
+                   COALESCE((SELECT SUM(deadline.ticket_count)
+                               FROM helpdesk_team_stats_deadline deadline
+                              WHERE deadline.team_id = team.id AND deadline.deadline_date <= %s), 0) AS upcoming_sla_fail_tickets
+              FROM unnest(%s) AS team(id)
+        """, (datetime.date.today(), list(team_ids)))
+        return {row.pop('id'): row for row in self.env.cr.dictfetchall()}
+
+    @api.model
+    def _update_stats(self, added, removed=None):
+        """ Add the counts of `added` to the statistics, and remove the ones of `removed`
+            :param added: mapping of (team_id, counter, deadline date) with a count, the counter being a field
+                of this model, or 'sla_deadline' for the tickets with an SLA deadline counted per date (see
+                `helpdesk.ticket._get_team_stats`); the date is False for the other counters
+            :param removed: idem, substracted from the statistics
+        """
+        stats = Counter(added)
+        stats.subtract(removed or {})
+        team_values = defaultdict(Counter)
+        deadline_values = []
+        for (team_id, counter, deadline_date), count in stats.items():
+            if not count:
+                continue
+            if counter == 'sla_deadline':
+                deadline_values.append((team_id, deadline_date, count))
+            else:
+                team_values[team_id][counter] += count
+        if team_values:
+            values = [
+                (team_id, counts['open_ticket_count'], counts['unassigned_ticket_count'], counts['sla_policy_count'])
+                for team_id, counts in team_values.items()
+            ]
+            self.flush()
+            self.env.cr.execute("""
+                INSERT INTO helpdesk_team_stats (team_id, open_ticket_count, unassigned_ticket_count, sla_policy_count)
+                     VALUES %s
+            """ % ', '.join(['%s'] * len(values)), values)
+            self.invalidate_cache()
+        if deadline_values:
+            self.env['helpdesk.team.stats.deadline'].flush()
+            self.env.cr.execute("""
+                INSERT INTO helpdesk_team_stats_deadline (team_id, deadline_date, ticket_count)
+                     VALUES %s
+            """ % ', '.join(['%s'] * len(deadline_values)), deadline_values)
+            self.env['helpdesk.team.stats.deadline'].invalidate_cache()
+
+    @api.model
+    def _merge(self):
+        """ Merge the rows of differences of each team, and of each team and date, into one. The rows inserted by
+            the transactions running meanwhile are not seen, thus neither removed nor merged.
+        """
+        self.flush()
+        self.env['helpdesk.team.stats.deadline'].flush()
+        self.env.cr.execute("""
+            WITH removed AS (
+                DELETE FROM helpdesk_team_stats
+                  RETURNING team_id, open_ticket_count, unassigned_ticket_count, sla_policy_count
+            )
+            INSERT INTO helpdesk_team_stats (team_id, open_ticket_count, unassigned_ticket_count, sla_policy_count)
+                 SELECT team_id, SUM(open_ticket_count), SUM(unassigned_ticket_count), SUM(sla_policy_count)
+                   FROM removed
+               GROUP BY team_id
+        """)
+        # the days before yesterday are always summed together: merge them as well
+        self.env.cr.execute("""
+            WITH removed AS (
+                DELETE FROM helpdesk_team_stats_deadline
+                  RETURNING team_id, deadline_date, ticket_count
+            )
+            INSERT INTO helpdesk_team_stats_deadline (team_id, deadline_date, ticket_count)
+                 SELECT team_id, GREATEST(deadline_date, %s), SUM(ticket_count)
+                   FROM removed
+               GROUP BY 1, 2
+                 HAVING SUM(ticket_count) != 0
+        """, (datetime.date.today() - relativedelta.relativedelta(days=1),))
+        self.invalidate_cache()
+        self.env['helpdesk.team.stats.deadline'].invalidate_cache()
+
+    @api.model
+    def _rebuild(self):
+        """ Count again the tickets and the SLA policies of all the teams """
+        self.env['helpdesk.ticket'].flush(['team_id', 'user_id', 'stage_id', 'is_closed', 'active', 'sla_deadline'])
+        self.env['helpdesk.sla'].flush(['team_id', 'active'])
+        self.env.cr.execute("DELETE FROM helpdesk_team_stats")
+        self.env.cr.execute("""
+            INSERT INTO helpdesk_team_stats (team_id, open_ticket_count, unassigned_ticket_count, sla_policy_count)
+                 SELECT team.id, COALESCE(ticket.open_count, 0), COALESCE(ticket.unassigned_count, 0), COALESCE(sla.sla_count, 0)
+                   FROM helpdesk_team team
+              LEFT JOIN (SELECT T.team_id, COUNT(*) AS open_count, COUNT(*) FILTER (WHERE T.user_id IS NULL) AS unassigned_count
+                           FROM helpdesk_ticket T
+                          WHERE T.active AND T.stage_id IS NOT NULL AND NOT COALESCE(T.is_closed, FALSE)
+                       GROUP BY T.team_id) ticket ON ticket.team_id = team.id
+              LEFT JOIN (SELECT team_id, COUNT(*) AS sla_count
+                           FROM helpdesk_sla
+                          WHERE active
+                       GROUP BY team_id) sla ON sla.team_id = team.id
+        """)
+        # the days before yesterday are always summed together: merge them, so that the rows do not pile up
+        self.env.cr.execute("DELETE FROM helpdesk_team_stats_deadline")
+        self.env.cr.execute("""
+            INSERT INTO helpdesk_team_stats_deadline (team_id, deadline_date, ticket_count)
+                 SELECT team_id, GREATEST((sla_deadline - interval '1 second')::date, %s), COUNT(*)
+                   FROM helpdesk_ticket
+                  WHERE active AND team_id IS NOT NULL AND sla_deadline IS NOT NULL
+               GROUP BY 1, 2
+        """, (datetime.date.today() - relativedelta.relativedelta(days=1),))
+        self.invalidate_cache()
+        self.env['helpdesk.team.stats.deadline'].invalidate_cache()
+
+
+class HelpdeskTeamStatsDeadline(models.Model):
+    """ Number of tickets of the teams per date from which they fail their SLA soon (see `helpdesk.team.stats`) """
+    _name = 'helpdesk.team.stats.deadline'
+    _description = 'Helpdesk Team SLA Deadlines'
+
+    team_id = fields.Many2one('helpdesk.team', string='Team', required=True, index=True, ondelete='cascade')
+    deadline_date = fields.Date('Date', required=True)
+    ticket_count = fields.Integer('Tickets', default=0)
+
+
+class HelpdeskDashboardVersion(models.Model):
+    """ Versions of the dashboard statistics of the users (see `helpdesk.team._get_dashboard_data`): a row is added
+        when the statistics of a user change, without user when the ones of all the users change, and the version
+        of a user is the last of its rows. The rows are only inserted, so that the writes of the tickets never
+        conflict with each other on them, and the old ones are removed by the autovacuum.
+    """
+    _name = 'helpdesk.dashboard.version'
+    _description = 'Helpdesk Dashboard Version'
+    _log_access = False
+
+    user_id = fields.Many2one('res.users', string='User', ondelete='cascade')
+
+    def init(self):
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS helpdesk_dashboard_version_user_id_id_index
+                ON helpdesk_dashboard_version (user_id, id)
+        """)
+
+    @api.model
+    def _get_version(self):
+        """ :returns the current version of the dashboard statistics of the current user """
+        self.flush()
+        self.env.cr.execute("""
+            SELECT GREATEST(
+                (SELECT MAX(id) FROM helpdesk_dashboard_version WHERE user_id = %s),
+                (SELECT MAX(id) FROM helpdesk_dashboard_version WHERE user_id IS NULL)
+            )
+        """, (self.env.uid,))
+        return self.env.cr.fetchone()[0] or 0
+
+    @api.model
+    def _bump_version(self, user_ids=None):
+        """ Bump the version of the dashboard statistics of the given users, of all of them if not given """
+        if user_ids is not None and not user_ids:
+            return
+        self.env.cr.execute("""
+            INSERT INTO helpdesk_dashboard_version (user_id)
+                 SELECT unnest(%s::integer[])
+        """, (sorted(user_ids) if user_ids is not None else [None],))
+
+    @api.autovacuum
+    def _gc_versions(self):
+        """ Remove the rows older than the current version of their user """
+        self.env.cr.execute("""
+            DELETE FROM helpdesk_dashboard_version version
+             WHERE EXISTS (
+                    SELECT 1
+                      FROM helpdesk_dashboard_version newer
+                     WHERE newer.user_id IS NOT DISTINCT FROM version.user_id
+                       AND newer.id > version.id
+             )
+        """)
@@ -1,19 +1,19 @@
 # -*- coding: utf-8 -*-
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
-import requests
-import json
-# REMEMBER TO INSTALL oauth2client before restarting Odoo by command (pip install oauth2client)
-from oauth2client.service_account import ServiceAccountCredentials
-
+import hashlib
 import math
+import time
+import uuid
+from collections import Counter, defaultdict
 from dateutil.relativedelta import relativedelta
 from random import randint
 
 from odoo import api, Command, fields, models, tools, _
-from odoo.tools import DEFAULT_SERVER_DATETIME_FORMAT, DEFAULT_SERVER_DATE_FORMAT
+from odoo.tools import DEFAULT_SERVER_DATETIME_FORMAT, DEFAULT_SERVER_DATE_FORMAT, html2plaintext, split_every
 from odoo.addons.iap.tools import iap_tools
+from odoo.addons.rating.models import rating as rating_model
 from odoo.osv import expression
-from odoo.exceptions import AccessError, ValidationError
+from odoo.exceptions import AccessError, UserError, ValidationError
 from datetime import datetime
 import re
 import logging
@@ -27,6 +27,19 @@ TICKET_PRIORITY = [
     ('3', 'Urgent'),
 ]
 
+# text search configuration of the search document of the tickets (see `_update_search_document`), and the
+# weights of its parts: subject, description and discussion messages
+SEARCH_DOCUMENT_CONFIG = 'simple'
+SEARCH_WEIGHT_SUBJECT = 'A'
+SEARCH_WEIGHT_DESCRIPTION = 'B'
+SEARCH_WEIGHT_MESSAGE = 'C'
+SEARCH_DOCUMENT_BATCH_SIZE = 1000
+
+# approximate counts of the tickets, per database, user, companies and domain: {key: (timestamp, count)}
+TICKET_COUNT_CACHE_TTL = 300
+TICKET_COUNT_CACHE_SIZE = 1000
+_ticket_count_cache = {}
+
 
 class HelpdeskTag(models.Model):
     _name = 'helpdesk.tag'
@@ -71,22 +84,74 @@ class HelpdeskSLAStatus(models.Model):
     deadline = fields.Datetime("Deadline", compute='_compute_deadline', compute_sudo=True, store=True)
     reached_datetime = fields.Datetime("Reached Date",
                                        help="Datetime at which the SLA stage was reached for the first time")
+    # stored, the ongoing status are flipped to failed by `_cron_sla_breach` when their deadline passes
     status = fields.Selection([('failed', 'Failed'), ('reached', 'Reached'), ('ongoing', 'Ongoing')], string="Status",
-                              compute='_compute_status', compute_sudo=True, search='_search_status')
+                              compute='_compute_status', compute_sudo=True, store=True, index=True)
     color = fields.Integer("Color Index", compute='_compute_color')
     exceeded_days = fields.Float("Excedeed Working Days", compute='_compute_exceeded_days', compute_sudo=True,
                                  store=True,
                                  help="Working days exceeded for reached SLAs compared with deadline. Positive number means the SLA was eached after the deadline.")
+    # freeze ledger: working hours spent in the excluded stages of the SLA, updated by `HelpdeskTicket.write`
+    freezed_hours = fields.Float("Freezed Hours", default=0,
+                                 help="Working hours spent by the ticket in the excluded stages of the SLA")
+    freeze_start = fields.Datetime("Freeze Start",
+                                   help="Datetime at which the ticket entered an excluded stage of the SLA, if it is still in it")
+
+    @api.model
+    def _get_sla_status_indexes(self):
+        """ Indexes of the hot SLA queries, maintained by `init`
+            :returns a mapping of index name with its definition on the table
+        """
+        return {
+            # late status of tickets (`_compute_sla_reached_late`) and join of the SLA report
+            'helpdesk_sla_status_ticket_deadline_index': '(ticket_id, deadline, reached_datetime)',
+            # unreached status of tickets (`_compute_sla_deadline`)
+            'helpdesk_sla_status_open_ticket_deadline_index': '(ticket_id, deadline) WHERE reached_datetime IS NULL',
+            # status to flag as reached when tickets change stage (`_sla_reach`)
+            'helpdesk_sla_status_open_stage_index': '(sla_stage_id, ticket_id) WHERE reached_datetime IS NULL',
+            # queue of the next breaches (`_cron_sla_breach`)
+            'helpdesk_sla_status_ongoing_deadline_index': "(deadline) WHERE status = 'ongoing'",
+        }
+
+    def init(self):
+        for index_name, definition in self._get_sla_status_indexes().items():
+            self.env.cr.execute("CREATE INDEX IF NOT EXISTS %s ON %s %s" % (index_name, self._table, definition))
 
     @api.depends('ticket_id.create_date', 'sla_id', 'ticket_id.stage_id')
     def _compute_deadline(self):
-        for status in self:
-            if (status.deadline and status.reached_datetime) or (
-                    status.deadline and not status.sla_id.exclude_stage_ids) or (status.status == 'failed'):
-                continue
+        """ Deadlines are resolved in batch: the working intervals of each calendar are expanded once
+            for the whole recordset (see `WorkingTimeline`), and the statuses sharing the same calendar,
+            SLA time and ticket creation date (without freezed time) share the same deadline.
+        """
+        now = fields.Datetime.now()
+        # the failed status (deadline passed) keep their deadline
+        statuses = self.filtered(lambda status: not (
+            (status.deadline and status.reached_datetime) or
+            (status.deadline and not status.sla_id.exclude_stage_ids) or
+            (status.deadline and status.deadline <= now)))
+
+        # expand the working intervals of each calendar from the oldest ticket covered
+        start_per_calendar = {}
+        for status in statuses:
+            working_calendar = status.ticket_id.team_id.resource_calendar_id
+            create_date = status.ticket_id.create_date
+            if working_calendar and create_date:
+                start = start_per_calendar.get(working_calendar, create_date)
+                start_per_calendar[working_calendar] = min(start, create_date)
+        work_timelines = {
+            calendar: calendar._get_working_timeline(start - relativedelta(days=1), compute_leaves=True)
+            for calendar, start in start_per_calendar.items()
+        }
+        attendance_timelines = {
+            calendar: calendar._get_working_timeline(start - relativedelta(days=1), compute_leaves=False)
+            for calendar, start in start_per_calendar.items()
+        }
+
+        deadline_per_key = {}
+        for status in statuses:
             deadline = status.ticket_id.create_date
             working_calendar = status.ticket_id.team_id.resource_calendar_id
-            if not working_calendar:
+            if not working_calendar or not deadline:
                 # Normally, having a working_calendar is mandatory
                 status.deadline = deadline
                 continue
@@ -96,14 +161,21 @@ class HelpdeskSLAStatus(models.Model):
                     # We are in the freezed time stage: No deadline
                     status.deadline = False
                     continue
+            else:
+                key = (working_calendar.id, status.sla_id.time, deadline)
+                if key in deadline_per_key:
+                    status.deadline = deadline_per_key[key]
+                    continue
+            work_timeline = work_timelines[working_calendar]
+            attendance_timeline = attendance_timelines[working_calendar]
 
             avg_hour = working_calendar.hours_per_day or 8  # default to 8 working hours/day
             time_days = math.floor(status.sla_id.time / avg_hour)
             if time_days > 0:
-                deadline = working_calendar.plan_days(time_days + 1, deadline, compute_leaves=True)
+                deadline = work_timeline.plan_days(time_days + 1, deadline)
                 # We should also depend on ticket creation time, otherwise for 1 day SLA, all tickets
                 # created on monday will have their deadline filled with tuesday 8:00
-                create_dt = working_calendar.plan_hours(0, status.ticket_id.create_date)
+                create_dt = attendance_timeline.plan_hours(0, status.ticket_id.create_date)
                 deadline = deadline.replace(hour=create_dt.hour, minute=create_dt.minute, second=create_dt.second,
                                             microsecond=create_dt.microsecond)
 
@@ -113,13 +185,15 @@ class HelpdeskSLAStatus(models.Model):
                 sla_hours += status._get_freezed_hours(working_calendar)
 
                 # Except if ticket creation time is later than the end time of the working day
-                deadline_for_working_cal = working_calendar.plan_hours(0, deadline)
+                deadline_for_working_cal = attendance_timeline.plan_hours(0, deadline)
                 if deadline_for_working_cal and deadline.day < deadline_for_working_cal.day:
                     deadline = deadline.replace(hour=0, minute=0, second=0, microsecond=0)
             # We should execute the function plan_hours in any case because, in a 1 day SLA environment,
             # if I create a ticket knowing that I'm not working the day after at the same time, ticket
             # deadline will be set at time I don't work (ticket creation time might not be in working calendar).
-            status.deadline = working_calendar.plan_hours(sla_hours, deadline, compute_leaves=True)
+            status.deadline = work_timeline.plan_hours(sla_hours, deadline)
+            if not status.sla_id.exclude_stage_ids:
+                deadline_per_key[key] = status.deadline
 
     @api.depends('deadline', 'reached_datetime')
     def _compute_status(self):
@@ -129,29 +203,6 @@ class HelpdeskSLAStatus(models.Model):
             else:  # if not finished, deadline should be compared to now()
                 status.status = 'ongoing' if not status.deadline or status.deadline > fields.Datetime.now() else 'failed'
 
-    @api.model
-    def _search_status(self, operator, value):
-        """ Supported operators: '=', 'in' and their negative form. """
-        # constants
-        datetime_now = fields.Datetime.now()
-        positive_domain = {
-            'failed': ['|', '&', ('reached_datetime', '=', True), ('deadline', '<=', 'reached_datetime'), '&',
-                       ('reached_datetime', '=', False), ('deadline', '<=', fields.Datetime.to_string(datetime_now))],
-            'reached': ['&', ('reached_datetime', '=', True), ('reached_datetime', '<', 'deadline')],
-            'ongoing': ['|', ('deadline', '=', False), '&', ('reached_datetime', '=', False),
-                        ('deadline', '>', fields.Datetime.to_string(datetime_now))]
-        }
-        # in/not in case: we treat value as a list of selection item
-        if not isinstance(value, list):
-            value = [value]
-        # transform domains
-        if operator in expression.NEGATIVE_TERM_OPERATORS:
-            # "('status', 'not in', [A, B])" tranformed into "('status', '=', C) OR ('status', '=', D)"
-            domains_to_keep = [dom for key, dom in positive_domain if key not in value]
-            return expression.OR(domains_to_keep)
-        else:
-            return expression.OR(positive_domain[value_item] for value_item in value)
-
     @api.depends('status')
     def _compute_color(self):
         for status in self:
@@ -164,45 +215,92 @@ class HelpdeskSLAStatus(models.Model):
 
     @api.depends('deadline', 'reached_datetime')
     def _compute_exceeded_days(self):
+        periods_by_calendar = defaultdict(list)
         for status in self:
-            if status.reached_datetime and status.deadline and status.ticket_id.team_id.resource_calendar_id:
+            calendar = status.ticket_id.team_id.resource_calendar_id
+            if status.reached_datetime and status.deadline and calendar:
                 if status.reached_datetime <= status.deadline:
-                    start_dt = status.reached_datetime
-                    end_dt = status.deadline
-                    factor = -1
+                    period = (status.reached_datetime, status.deadline, -1)
                 else:
-                    start_dt = status.deadline
-                    end_dt = status.reached_datetime
-                    factor = 1
-                duration_data = status.ticket_id.team_id.resource_calendar_id.get_work_duration_data(start_dt, end_dt,
-                                                                                                     compute_leaves=True)
-                status.exceeded_days = duration_data['days'] * factor
+                    period = (status.deadline, status.reached_datetime, 1)
+                periods_by_calendar[calendar].append((status, period))
             else:
                 status.exceeded_days = False
+        # one working timeline per calendar for all the status
+        for calendar, status_periods in periods_by_calendar.items():
+            durations = calendar._get_work_duration_data_batch(
+                [(start_dt, end_dt) for dummy, (start_dt, end_dt, factor) in status_periods], compute_leaves=True)
+            for (status, (start_dt, end_dt, factor)), duration_data in zip(status_periods, durations):
+                status.exceeded_days = duration_data['days'] * factor
+
+    @api.model
+    def _cron_sla_breach(self):
+        """ Flag the ongoing status whose deadline passed as failed, with their tickets, then schedule the
+            next run when the next deadline passes.
+        """
+        now = fields.Datetime.now()
+        statuses = self.search([('status', '=', 'ongoing'), ('deadline', '<=', now)], order='deadline')
+        if statuses:
+            self.env.add_to_compute(self._fields['status'], statuses)
+            tickets = statuses.ticket_id
+            # the open tickets fail on the dashboards when their first deadline passes: before the first deadline
+            # passed since the last run, only the tickets failed by the previous runs were counted as failed
+            dashboard_before = tickets._get_dashboard_stats(sla_now=statuses[0].deadline)
+            for fname in ['sla_reached_late', 'sla_fail', 'sla_success']:
+                self.env.add_to_compute(tickets._fields[fname], tickets)
+            statuses.flush()
+            tickets.flush()
+            self.env['helpdesk.team']._notify_dashboard(tickets._get_dashboard_stats(sla_now=now), dashboard_before)
+        self.search([('status', '=', 'ongoing'), ('deadline', '>', now)], order='deadline', limit=1)._schedule_sla_breach()
+
+    def _schedule_sla_breach(self):
+        """ Trigger the breach cron when the first deadline of the current ongoing status passes """
+        deadlines = [status.deadline for status in self if status.status == 'ongoing' and status.deadline]
+        cron = self.env.ref('helpdesk.ir_cron_sla_breach', raise_if_not_found=False)
+        if deadlines and cron:
+            cron.sudo()._trigger(at=min(deadlines))
 
     def _get_freezed_hours(self, working_calendar):
         self.ensure_one()
-        hours_freezed = 0
-
-        field_stage = self.env['ir.model.fields']._get(self.ticket_id._name, "stage_id")
-        freeze_stages = self.sla_id.exclude_stage_ids.ids
-        tracking_lines = self.ticket_id.message_ids.tracking_value_ids.filtered(
-            lambda tv: tv.field == field_stage).sorted(key="create_date")
-
-        if not tracking_lines:
-            return 0
-
-        old_time = self.ticket_id.create_date
-        for tracking_line in tracking_lines:
-            if tracking_line.old_value_integer in freeze_stages:
-                # We must use get_work_hours_count to compute real waiting hours (as the deadline computation is also based on calendar)
-                hours_freezed += working_calendar.get_work_hours_count(old_time, tracking_line.create_date)
-            old_time = tracking_line.create_date
-        if tracking_lines[-1].new_value_integer in freeze_stages:
-            # the last tracking line is not yet created
-            hours_freezed += working_calendar.get_work_hours_count(old_time, fields.Datetime.now())
+        hours_freezed = self.freezed_hours
+        if self.freeze_start:
+            # the current freeze period is not yet closed
+            hours_freezed += working_calendar.get_work_hours_count(self.freeze_start, fields.Datetime.now())
         return hours_freezed
 
+    def _sla_freeze_update(self, stage):
+        """ Update the freeze ledger of the current statuses for their tickets moving to the given stage: the
+            freeze period starts when entering an excluded stage of the SLA, and its working hours are added
+            to `freezed_hours` when leaving it.
+        """
+        now = fields.Datetime.now()
+        statuses = self.filtered(lambda status: status.sla_id.exclude_stage_ids and not status.reached_datetime)
+        to_freeze = statuses.filtered(lambda status: not status.freeze_start and stage in status.sla_id.exclude_stage_ids)
+        to_freeze.write({'freeze_start': now})
+        for status in statuses.filtered(lambda status: status.freeze_start and stage not in status.sla_id.exclude_stage_ids):
+            working_calendar = status.ticket_id.team_id.resource_calendar_id
+            hours = working_calendar.get_work_hours_count(status.freeze_start, now) if working_calendar else 0
+            status.write({'freezed_hours': status.freezed_hours + hours, 'freeze_start': False})
+
+    def _sla_freeze_init_from_tracking(self):
+        """ Rebuild the freeze ledger of the current statuses from the stage tracking of their tickets. Only
+            needed for statuses created before the ledger existed.
+        """
+        field_stage = self.env['ir.model.fields']._get('helpdesk.ticket', "stage_id")
+        for status in self.filtered(lambda status: status.sla_id.exclude_stage_ids):
+            working_calendar = status.ticket_id.team_id.resource_calendar_id
+            freeze_stages = status.sla_id.exclude_stage_ids.ids
+            tracking_lines = status.ticket_id.message_ids.tracking_value_ids.filtered(
+                lambda tv: tv.field == field_stage).sorted(key="create_date")
+            hours_freezed = 0
+            old_time = status.ticket_id.create_date
+            for tracking_line in tracking_lines:
+                if tracking_line.old_value_integer in freeze_stages and working_calendar:
+                    hours_freezed += working_calendar.get_work_hours_count(old_time, tracking_line.create_date)
+                old_time = tracking_line.create_date
+            freeze_start = old_time if status.ticket_id.stage_id.id in freeze_stages else False
+            status.write({'freezed_hours': hours_freezed, 'freeze_start': freeze_start})
+
 
 class HelpdeskTicket(models.Model):
     _name = 'helpdesk.ticket'
@@ -210,6 +308,28 @@ class HelpdeskTicket(models.Model):
     _order = "create_date desc"
     _inherit = ['portal.mixin', 'mail.thread.cc', 'utm.mixin', 'rating.mixin', 'mail.activity.mixin']
 
+    def init(self):
+        super().init()
+        # substring search on the ticket references, when the trigram extension is available
+        self.env.cr.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if self.env.cr.fetchone():
+            self.env.cr.execute("""
+                CREATE INDEX IF NOT EXISTS helpdesk_ticket_number_display_trgm_index
+                    ON helpdesk_ticket USING gin (ticket_number_display gin_trgm_ops)
+            """)
+        # full text search document, not an ORM field: maintained by `_update_search_document`
+        self.env.cr.execute("""
+            SELECT 1 FROM information_schema.columns
+             WHERE table_name = 'helpdesk_ticket' AND column_name = 'search_document'
+        """)
+        if not self.env.cr.fetchone():
+            self.env.cr.execute("ALTER TABLE helpdesk_ticket ADD COLUMN search_document tsvector")
+            self._update_search_document(all_tickets=True)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS helpdesk_ticket_search_document_index
+                ON helpdesk_ticket USING gin (search_document)
+        """)
+
     @api.model
     def default_get(self, fields):
         result = super(HelpdeskTicket, self).default_get(fields)
@@ -275,6 +395,12 @@ class HelpdeskTicket(models.Model):
     commercial_partner_id = fields.Many2one(related="partner_id.commercial_partner_id")
     closed_by_partner = fields.Boolean('Closed by Partner', readonly=True,
                                        help="If checked, this means the ticket was closed through the customer portal by the customer.")
+    last_message_author_id = fields.Many2one('res.partner', string='Last Message Author', readonly=True, index=True, copy=False,
+                                             help="Author of the last discussion message posted on the ticket.")
+    last_message_is_customer = fields.Boolean('Last Message from Customer', compute='_compute_last_message_is_customer',
+                                              store=True, index=True)
+    fulltext_search = fields.Char('Full Text', compute='_compute_fulltext_search', search='_search_fulltext_search',
+                                  help="Search in the subject, the description and the discussion messages of the tickets.")
     cmform = fields.Char(string="CM Form")
     attachment_ids = fields.One2many('ir.attachment', 'res_id',
                                      domain=[('res_model', '=', 'helpdesk.ticket')],
@@ -289,6 +415,9 @@ class HelpdeskTicket(models.Model):
         'helpdesk.stage', string='Stage', compute='_compute_user_and_stage_ids', store=True,
         readonly=False, ondelete='restrict', tracking=True, group_expand='_read_group_stage_ids',
         copy=False, index=True, domain="[('team_ids', '=', team_id)]")
+    is_closed = fields.Boolean(
+        'Closed', compute='_compute_is_closed', store=True, index=True,
+        help="The stage of the ticket is a closing stage. Kept up to date by the stages when they become closing or not.")
     date_last_stage_update = fields.Datetime("Last Stage Update", copy=False, readonly=True)
     # next 4 fields are computed in write (or create)
     assign_date = fields.Datetime("Assign Date")
@@ -306,8 +435,10 @@ class HelpdeskTicket(models.Model):
                                       store=True)
     sla_deadline = fields.Datetime("SLA Deadline", compute='_compute_sla_deadline', compute_sudo=True, store=True,
                                    help="The closest deadline of all SLA applied on this ticket")
-    sla_fail = fields.Boolean("Failed SLA Policy", compute='_compute_sla_fail', search='_search_sla_fail')
-    sla_success = fields.Boolean("Success SLA Policy", compute='_compute_sla_success', search='_search_sla_success')
+    # stored, refreshed by `helpdesk.sla.status._cron_sla_breach` when a deadline passes
+    sla_fail = fields.Boolean("Failed SLA Policy", compute='_compute_sla_fail', compute_sudo=True, store=True, index=True)
+    sla_success = fields.Boolean("Success SLA Policy", compute='_compute_sla_success', compute_sudo=True, store=True,
+                                 index=True)
 
     use_credit_notes = fields.Boolean(related='team_id.use_credit_notes', string='Use Credit Notes')
     use_coupons = fields.Boolean(related='team_id.use_coupons', string='Use Coupons')
@@ -353,13 +484,20 @@ class HelpdeskTicket(models.Model):
     is_saved = fields.Boolean(compute='_compute_is_saved')
     ticket_number = fields.Integer(string="Ticket Number", readonly=True, default="5197")
     ticket_number_display = fields.Char(string="Ticket Number Display", compute="_compute_ticket_number_display",
-                                        store=True)
+                                        store=True, index=True)
 
-    @api.depends('ticket_number')
+    @api.depends('create_date')
     def _compute_ticket_number_display(self):
+        # the reference only depends on the ticket: TN<id>-<creation day>-<id with thousands separators>
+        days = {}
         for record in self:
-            record.ticket_number_display = str("TN") + str(record.id) + "-" + datetime.today().strftime(
-                '%Y%m%d') + "-" + "{:,}".format(record.id)
+            if not record.id or not record.create_date:
+                record.ticket_number_display = False
+                continue
+            day = record.create_date.date()
+            if day not in days:
+                days[day] = day.strftime('%Y%m%d')
+            record.ticket_number_display = "TN%d-%s-%s" % (record.id, days[day], "{:,}".format(record.id))
 
     @api.depends('create_date')
     def _compute_is_saved(self):
@@ -553,29 +691,12 @@ class HelpdeskTicket(models.Model):
             else:
                 ticket.sla_fail = ticket.sla_reached_late
 
-    @api.model
-    def _search_sla_fail(self, operator, value):
-        datetime_now = fields.Datetime.now()
-        if (value and operator in expression.NEGATIVE_TERM_OPERATORS) or (
-                not value and operator not in expression.NEGATIVE_TERM_OPERATORS):  # is not failed
-            return ['&', ('sla_reached_late', '=', False), '|', ('sla_deadline', '=', False),
-                    ('sla_deadline', '>=', datetime_now)]
-        return ['|', ('sla_reached_late', '=', True), ('sla_deadline', '<', datetime_now)]  # is failed
-
     @api.depends('sla_deadline', 'sla_reached_late')
     def _compute_sla_success(self):
         now = fields.Datetime.now()
         for ticket in self:
             ticket.sla_success = (ticket.sla_deadline and ticket.sla_deadline > now)
 
-    @api.model
-    def _search_sla_success(self, operator, value):
-        datetime_now = fields.Datetime.now()
-        if (value and operator in expression.NEGATIVE_TERM_OPERATORS) or (
-                not value and operator not in expression.NEGATIVE_TERM_OPERATORS):  # is failed
-            return [('sla_status_ids.reached_datetime', '>', datetime_now), ('sla_reached_late', '!=', False)]
-        return [('sla_status_ids.reached_datetime', '<', datetime_now), ('sla_fail', '=', False)]  # is success
-
     @api.depends('team_id')
     def _compute_user_and_stage_ids(self):
         for ticket in self.filtered(lambda ticket: ticket.team_id):
@@ -584,6 +705,25 @@ class HelpdeskTicket(models.Model):
             if not ticket.stage_id or ticket.stage_id not in ticket.team_id.stage_ids:
                 ticket.stage_id = ticket.team_id._determine_stage()[ticket.team_id.id]
 
+    def _compute_fulltext_search(self):
+        self.fulltext_search = False
+
+    def _search_fulltext_search(self, operator, value):
+        if operator not in ('ilike', '=') or not isinstance(value, str):
+            raise UserError(_('Operation not supported'))
+        return self._get_fulltext_domain(value)
+
+    @api.depends('last_message_author_id', 'partner_id')
+    def _compute_last_message_is_customer(self):
+        for ticket in self:
+            ticket.last_message_is_customer = bool(ticket.last_message_author_id) and ticket.last_message_author_id == ticket.partner_id
+
+    @api.depends('stage_id')
+    def _compute_is_closed(self):
+        # not depending on stage_id.is_close: the stages update their tickets in one query when it changes
+        for ticket in self:
+            ticket.is_closed = ticket.stage_id.is_close
+
     @api.depends('partner_id')
     def _compute_partner_name(self):
         for ticket in self:
@@ -627,29 +767,29 @@ class HelpdeskTicket(models.Model):
 
     @api.depends('assign_date')
     def _compute_assign_hours(self):
-        for ticket in self:
-            create_date = fields.Datetime.from_string(ticket.create_date)
-            if create_date and ticket.assign_date and ticket.team_id.resource_calendar_id:
-                duration_data = ticket.team_id.resource_calendar_id.get_work_duration_data(create_date,
-                                                                                           fields.Datetime.from_string(
-                                                                                               ticket.assign_date),
-                                                                                           compute_leaves=True)
-                ticket.assign_hours = duration_data['hours']
-            else:
-                ticket.assign_hours = False
+        self._compute_working_hours('assign_hours', 'assign_date')
 
     @api.depends('create_date', 'close_date')
     def _compute_close_hours(self):
+        self._compute_working_hours('close_hours', 'close_date')
+
+    def _compute_working_hours(self, field_name, date_field_name):
+        """ Set `field_name` to the working hours of the team between the creation of the tickets and
+            `date_field_name`, with a single working timeline per calendar.
+        """
+        ticket_ids_by_calendar = defaultdict(list)
         for ticket in self:
-            create_date = fields.Datetime.from_string(ticket.create_date)
-            if create_date and ticket.close_date:
-                duration_data = ticket.team_id.resource_calendar_id.get_work_duration_data(create_date,
-                                                                                           fields.Datetime.from_string(
-                                                                                               ticket.close_date),
-                                                                                           compute_leaves=True)
-                ticket.close_hours = duration_data['hours']
+            calendar = ticket.team_id.resource_calendar_id
+            if ticket.create_date and ticket[date_field_name] and calendar:
+                ticket_ids_by_calendar[calendar].append(ticket.id)
             else:
-                ticket.close_hours = False
+                ticket[field_name] = False
+        for calendar, ticket_ids in ticket_ids_by_calendar.items():
+            tickets = self.browse(ticket_ids)
+            durations = calendar._get_work_duration_data_batch(
+                [(ticket.create_date, ticket[date_field_name]) for ticket in tickets], compute_leaves=True)
+            for ticket, duration_data in zip(tickets, durations):
+                ticket[field_name] = duration_data['hours']
 
     @api.depends('close_hours')
     def _compute_open_hours(self):
@@ -710,31 +850,21 @@ class HelpdeskTicket(models.Model):
         for team in teams:
             team_default_map[team.id] = {
                 'stage_id': team._determine_stage()[team.id].id,
-                'user_id': team._determine_user_to_assign()[team.id].id
             }
+        # users of the tickets to assign, reserved in a single pass for each team
+        assign_counts = Counter(vals['team_id'] for vals in list_value if vals.get('team_id') and 'user_id' not in vals)
+        team_users_map = self.env['helpdesk.team'].browse(list(assign_counts))._assign_users(assign_counts)
+
+        # Get the next ticket numbers from the sequence, reserved at once for the whole batch
+        ticket_numbers = self.env['ir.sequence']._next_by_code_batch('helpdesk.ticket', len(list_value))
+
+        for vals, ticket_number in zip(list_value, ticket_numbers):
+            vals['ticket_number'] = ticket_number
 
         # Manually create a partner now since 'generate_recipients' doesn't keep the name. This is
         # to avoid intrusive changes in the 'mail' module
         # TDE TODO: to extract and clean in mail thread
-        for vals in list_value:
-            # Get next ticket number from the sequence
-            vals['ticket_number'] = self.env['ir.sequence'].next_by_code('helpdesk.ticket')
-            partner_id = vals.get('partner_id', False)
-            partner_name = vals.get('partner_name', False)
-            partner_email = vals.get('partner_email', False)
-            if partner_name and partner_email and not partner_id:
-                parsed_name, parsed_email = self.env['res.partner']._parse_partner_name(partner_email)
-                if not parsed_name:
-                    parsed_name = partner_name
-                if vals.get('team_id'):
-                    team = self.env['helpdesk.team'].browse(vals.get('team_id'))
-                    company = team.company_id.id
-                else:
-                    company = False
-
-                vals['partner_id'] = self.env['res.partner'].with_context(default_company_id=company).find_or_create(
-                    tools.formataddr((parsed_name, parsed_email))
-                ).id
+        self._resolve_partners(list_value, {team.id: team.company_id.id for team in teams})
 
         # determine partner email for ticket with partner but no email given
         partners = self.env['res.partner'].browse([vals['partner_id'] for vals in list_value if
@@ -748,11 +878,8 @@ class HelpdeskTicket(models.Model):
                 team_default = team_default_map[vals['team_id']]
                 if 'stage_id' not in vals:
                     vals['stage_id'] = team_default['stage_id']
-                # Note: this will break the randomly distributed user assignment. Indeed, it will be too difficult to
-                # equally assigned user when creating ticket in batch, as it requires to search after the last assigned
-                # after every ticket creation, which is not very performant. We decided to not cover this user case.
                 if 'user_id' not in vals:
-                    vals['user_id'] = team_default['user_id']
+                    vals['user_id'] = team_users_map[vals['team_id']].pop(0).id
                 if vals.get(
                         'user_id'):  # if a user is finally assigned, force ticket assign_date and reset assign_hours
                     vals['assign_date'] = fields.Datetime.now()
@@ -770,155 +897,493 @@ class HelpdeskTicket(models.Model):
         # context: no_log, because subtype already handle this
         tickets = super(HelpdeskTicket, self).create(list_value)
         # make customer follower
-        for ticket in tickets:
-            if ticket.partner_id:
-                ticket.message_subscribe(partner_ids=ticket.partner_id.ids)
-            # Send FCM notification
-            if ticket.user_id.fcm_token_id:
-                # Retrieve all tokens for the user
-                fcm_tokens = self.env['fcm.token'].search([('user_id', '=', ticket.user_id.id)])
-                for token in fcm_tokens:
-                    print('Sending notification to FCM token:', token.token)
-
-                    # Load the service account key JSON file.
-                    creds = ServiceAccountCredentials.from_json_keyfile_name(
-                        r'C:\Users\DELL\odoo15\addons\helpdesk\sigma-helpdesk-firebase-adminsdk-3ayru-601327b0dd.json',
-                        ['https://www.googleapis.com/auth/firebase.messaging']
-                    )
-
-                    # Obtain an access token.
-                    access_token_info = creds.get_access_token()
-                    access_token = access_token_info.access_token
-
-                    print('Access token obtained:', access_token)
-
-                    url = 'https://fcm.googleapis.com/v1/projects/sigma-helpdesk/messages:send'
-                    headers = {
-                        'Content-Type': 'application/json',
-                        'Authorization': 'Bearer ' + access_token,
-                    }
-                    data = {
-                        'message': {
-                            'token': token.token,
-                            'notification': {
-                                'title': 'New Ticket: ' + str(ticket.ticket_number),
-                                'body': 'A new ticket has been assigned to you.',
-                            },
-                        },
-                    }
-                    try:
-                        response = requests.post(url, headers=headers, data=json.dumps(data))
-                        if response.status_code == 200:
-                            print('Notification sent successfully to:', token.token)
-                        else:
-                            print('Notification not sent. Response:', response.content)
-                    except Exception as e:
-                        print('Error sending notification to:', token.token, 'Error:', e)
-                print('Retrieved FCM tokens for user:', ticket.user_id.id, 'Tokens:', [t.token for t in fcm_tokens])
-
-            ticket._portal_ensure_token()
+        tickets._message_subscribe_customers()
+        tickets._portal_ensure_tokens()
+        self.env['helpdesk.team.load'].sudo()._update_load(tickets.sudo()._get_open_ticket_load())
+        self.env['helpdesk.team']._invalidate_dashboard_cache(set(tickets.sudo().user_id.ids))
+        # push notifications to the assigned users, sent by the outbox cron
+        self.env['fcm.notification']._enqueue_ticket_assignment(tickets)
+
+        tickets._update_search_document()
 
         # apply SLA
         tickets.sudo()._sla_apply()
+        self.env['helpdesk.team']._notify_dashboard(tickets.sudo()._get_dashboard_stats())
+        self.env['helpdesk.team.stats'].sudo()._update_stats(tickets.sudo()._get_team_stats())
 
         return tickets
 
     def write(self, vals):
         # we set the assignation date (assign_date) to now for tickets that are being assigned for the first time
         # same thing for the closing date
-        assigned_tickets = closed_tickets = self.browse()
+        set_assign_date = set_close_date = False
         if vals.get('user_id'):
-            assigned_tickets = self.filtered(lambda ticket: not ticket.assign_date)
+            set_assign_date = True
 
         if vals.get('stage_id'):
             if self.env['helpdesk.stage'].browse(vals.get('stage_id')).is_close:
-                closed_tickets = self.filtered(lambda ticket: not ticket.close_date)
+                set_close_date = True
             else:  # auto reset the 'closed_by_partner' flag
                 vals['closed_by_partner'] = False
                 vals['close_date'] = False
 
         now = fields.Datetime.now()
+        date_names = [date_name for date_name, to_set in [('assign_date', set_assign_date), ('close_date', set_close_date)] if to_set]
+
+        # open tickets of the team members, before the update
+        update_load = any(field_name in vals for field_name in ['team_id', 'user_id', 'stage_id', 'active'])
+        if update_load:
+            load_before = self.sudo()._get_open_ticket_load()
+        # the counters of the teams, the SLA deadlines being updated with the SLA
+        update_stats = any(field_name in vals for field_name in ['team_id', 'user_id', 'stage_id', 'active'] + self._sla_reset_trigger())
+        if update_stats:
+            stats_before = self.sudo()._get_team_stats()
+        # the dashboard of the users shows their open and closed tickets
+        update_dashboard = any(field_name in vals for field_name in ['user_id', 'stage_id', 'active', 'priority', 'close_date'] + self._sla_reset_trigger())
+        if update_dashboard:
+            dashboard_user_ids = set(self.sudo().user_id.ids)
+            dashboard_before = self.sudo()._get_dashboard_stats()
 
         # update last stage date when changing stage
         if 'stage_id' in vals:
+            # close or open the freeze periods of the SLA before the deadlines get recomputed
+            self.sudo().sla_status_ids._sla_freeze_update(self.env['helpdesk.stage'].browse(vals['stage_id']))
             vals['date_last_stage_update'] = now
             if 'kanban_state' not in vals:
                 vals['kanban_state'] = 'normal'
 
-        res = super(HelpdeskTicket, self - assigned_tickets - closed_tickets).write(vals)
-        res &= super(HelpdeskTicket, assigned_tickets - closed_tickets).write(dict(vals, **{
-            'assign_date': now,
-        }))
-        res &= super(HelpdeskTicket, closed_tickets - assigned_tickets).write(dict(vals, **{
-            'close_date': now,
-        }))
-        res &= super(HelpdeskTicket, assigned_tickets & closed_tickets).write(dict(vals, **{
-            'assign_date': now,
-            'close_date': now,
-        }))
+        res = self._write_with_dates(vals, date_names, now)
 
-        if vals.get('partner_id'):
-            self.message_subscribe([vals['partner_id']])
-
-        # SLA business
+        # SLA business, right after the writes: nothing flushed the tickets yet, so their new values, the SLA
+        # status reached and the fields depending on both are sent in the same flush
         sla_triggers = self._sla_reset_trigger()
         if any(field_name in sla_triggers for field_name in vals.keys()):
             self.sudo()._sla_apply(keep_reached=True)
         if 'stage_id' in vals:
             self.sudo()._sla_reach(vals['stage_id'])
+            # the deadline of the SLA with freezed time may have moved
+            self.sudo().sla_status_ids.filtered(lambda status: status.sla_id.exclude_stage_ids)._schedule_sla_breach()
+
+        if update_load:
+            self.env['helpdesk.team.load'].sudo()._update_load(self.sudo()._get_open_ticket_load(), load_before)
+
+        if update_dashboard:
+            self.env['helpdesk.team']._invalidate_dashboard_cache(dashboard_user_ids | set(self.sudo().user_id.ids))
+
+        if 'name' in vals or 'description' in vals:
+            self._update_search_document()
+
+        if vals.get('partner_id'):
+            self.message_subscribe([vals['partner_id']])
+
+        # the SLA of the tickets are up to date: push the changes to the dashboards
+        if update_dashboard:
+            self.env['helpdesk.team']._notify_dashboard(self.sudo()._get_dashboard_stats(), dashboard_before)
+        if update_stats:
+            self.env['helpdesk.team.stats'].sudo()._update_stats(self.sudo()._get_team_stats(), stats_before)
 
         return res
 
+    def _write_with_dates(self, vals, date_names, now):
+        """ Write `vals` on the tickets, and set the given date fields to `now` on the tickets not having them yet.
+            The tickets are grouped per dates to set in a single pass, and written once per group.
+        """
+        ticket_ids_per_dates = defaultdict(list)
+        for ticket in self:
+            dates = tuple(date_name for date_name in date_names if not ticket[date_name])
+            ticket_ids_per_dates[dates].append(ticket.id)
+        res = True
+        for dates, ticket_ids in ticket_ids_per_dates.items():
+            res &= super(HelpdeskTicket, self.browse(ticket_ids)).write(dict(vals, **dict.fromkeys(dates, now)))
+        return res
+
+    def unlink(self):
+        self.env['helpdesk.team.load'].sudo()._update_load({}, self.sudo()._get_open_ticket_load())
+        self.env['helpdesk.team']._invalidate_dashboard_cache(set(self.sudo().user_id.ids))
+        self.env['helpdesk.team']._notify_dashboard({}, self.sudo()._get_dashboard_stats())
+        self.env['helpdesk.team.stats'].sudo()._update_stats({}, self.sudo()._get_team_stats())
+        return super(HelpdeskTicket, self.with_context(helpdesk_unlink_ticket_ids=self.ids)).unlink()
+
     # ------------------------------------------------------------
     # Actions and Business methods
     # ------------------------------------------------------------
 
+    def _message_subscribe_customers(self):
+        """ Batched `message_subscribe` of the customer of each ticket (with the default subtypes): the missing
+            followers of all the tickets are created at once.
+        """
+        tickets = self.filtered('partner_id')
+        if not tickets:
+            return
+        Followers = self.env['mail.followers'].sudo()
+        existing = {
+            (follower.res_id, follower.partner_id.id)
+            for follower in Followers.search([
+                ('res_model', '=', self._name),
+                ('res_id', 'in', tickets.ids),
+                ('partner_id', 'in', tickets.partner_id.ids),
+            ])
+        }
+        default_subtypes, dummy, external_subtypes = self.env['mail.message.subtype'].default_subtypes(self._name)
+        follower_values = []
+        for ticket in tickets:
+            if (ticket.id, ticket.partner_id.id) in existing:
+                continue
+            existing.add((ticket.id, ticket.partner_id.id))
+            # customers only follow the external subtypes, as in `mail.followers._add_default_followers`
+            subtypes = external_subtypes if ticket.partner_id.partner_share else default_subtypes
+            follower_values.append({
+                'res_model': self._name,
+                'res_id': ticket.id,
+                'partner_id': ticket.partner_id.id,
+                'subtype_ids': [Command.set(subtypes.ids)],
+            })
+        Followers.create(follower_values)
+
+    def _portal_ensure_tokens(self):
+        """ Batched `_portal_ensure_token`: the missing access tokens are set with a single UPDATE """
+        tickets = self.filtered(lambda ticket: not ticket.access_token)
+        if not tickets:
+            return
+        tickets.flush(['access_token'])
+        values = [(ticket.id, str(uuid.uuid4())) for ticket in tickets]
+        self.env.cr.execute("""
+            UPDATE helpdesk_ticket
+               SET access_token = token.access_token
+              FROM (VALUES %s) AS token(id, access_token)
+             WHERE helpdesk_ticket.id = token.id
+        """ % ', '.join(['%s'] * len(values)), values)
+        tickets.invalidate_cache(['access_token'], tickets.ids)
+
+    @api.model
+    def _resolve_partners(self, list_value, team_company_map):
+        """ Set the partner of the values giving a customer name and email but no partner: the existing partners
+            are found with a single search on their normalized email, and the missing ones are created at once.
+            :param list_value: list of the values of the tickets to create, updated in place
+            :param team_company_map: mapping of team identifier with its company identifier
+        """
+        Partner = self.env['res.partner']
+        vals_by_email = defaultdict(list)  # normalized email -> list of (vals, parsed name, parsed email)
+        for vals in list_value:
+            partner_name = vals.get('partner_name', False)
+            partner_email = vals.get('partner_email', False)
+            if partner_name and partner_email and not vals.get('partner_id'):
+                parsed_name, parsed_email = Partner._parse_partner_name(partner_email)
+                if not parsed_name:
+                    parsed_name = partner_name
+                email_normalized = tools.email_normalize(parsed_email)
+                if not email_normalized:
+                    # no email to match the partners on
+                    company = team_company_map.get(vals.get('team_id'), False)
+                    vals['partner_id'] = Partner.with_context(default_company_id=company).find_or_create(
+                        tools.formataddr((parsed_name, parsed_email))
+                    ).id
+                    continue
+                vals_by_email[email_normalized].append((vals, parsed_name, parsed_email))
+        if not vals_by_email:
+            return
+
+        partner_by_email = {}
+        for partner in Partner.search([('email_normalized', 'in', list(vals_by_email))]):
+            partner_by_email.setdefault(partner.email_normalized, partner)
+        missing_emails = [email for email in vals_by_email if email not in partner_by_email]
+        partner_values = []
+        for email in missing_emails:
+            vals, parsed_name, parsed_email = vals_by_email[email][0]
+            partner_values.append({
+                'name': parsed_name or parsed_email,
+                'email': parsed_email,
+                'company_id': team_company_map.get(vals.get('team_id'), False),
+            })
+        partner_by_email.update(zip(missing_emails, Partner.create(partner_values)))
+
+        for email, vals_list in vals_by_email.items():
+            for vals, parsed_name, parsed_email in vals_list:
+                vals['partner_id'] = partner_by_email[email].id
+
+    @api.model
+    def _get_ticket_by_ref(self, ref):
+        """ Return the ticket of the given reference (`ticket_number_display`), found with an exact match on
+            the indexed reference.
+        """
+        if not ref:
+            return self.browse()
+        return self.search([('ticket_number_display', '=', ref)], limit=1)
+
+    @api.model
+    def _get_approximate_count(self, domain):
+        """ Count the tickets matching the domain, cached per user and domain for `TICKET_COUNT_CACHE_TTL`
+            seconds: the count may be slightly outdated, e.g. to show the number of pages of a long list.
+        """
+        domain_hash = hashlib.sha1(repr(domain).encode()).hexdigest()
+        key = (self.env.cr.dbname, self.env.uid, tuple(self.env.companies.ids), domain_hash)
+        now = time.time()
+        cached = _ticket_count_cache.get(key)
+        if cached and cached[0] > now - TICKET_COUNT_CACHE_TTL:
+            return cached[1]
+        count = self.search_count(domain)
+        if len(_ticket_count_cache) >= TICKET_COUNT_CACHE_SIZE:
+            for cached_key, (timestamp, dummy) in list(_ticket_count_cache.items()):
+                if timestamp <= now - TICKET_COUNT_CACHE_TTL:
+                    _ticket_count_cache.pop(cached_key, None)
+            if len(_ticket_count_cache) >= TICKET_COUNT_CACHE_SIZE:
+                _ticket_count_cache.clear()
+        _ticket_count_cache[key] = (now, count)
+        return count
+
+    @api.model
+    def _get_search_document_query(self, search, weights=None):
+        """ Convert the words of a search into a text search query of the search document, matching the words
+            (or their beginning) found in the given parts of the document
+            :param weights: the weights of the parts of the document to search in, all of them by default
+            :returns the query, or False if there is no word to search
+        """
+        words = re.findall(r'\w+', search or '')
+        if not words:
+            return False
+        return ' & '.join('%s:*%s' % (word, weights or '') for word in words)
+
+    @api.model
+    def _get_fulltext_domain(self, search, weights=None):
+        """ Domain of the tickets matching the given search, using the index of their search document """
+        query = self._get_search_document_query(search, weights)
+        if not query:
+            return expression.FALSE_DOMAIN
+        return [('id', 'inselect', (
+            "SELECT id FROM helpdesk_ticket WHERE search_document @@ to_tsquery(%s, %s)",
+            [SEARCH_DOCUMENT_CONFIG, query],
+        ))]
+
+    @api.model
+    def _fulltext_search(self, search, domain=None, weights=None, limit=None, offset=0):
+        """ Search the tickets matching the given text, the most relevant first
+            :param domain: additional domain of the tickets
+            :param weights: the weights of the parts of the document to search in, all of them by default (see
+                `SEARCH_WEIGHT_SUBJECT`, `SEARCH_WEIGHT_DESCRIPTION` and `SEARCH_WEIGHT_MESSAGE`)
+            :returns the tickets, ordered by relevance
+        """
+        tsquery = self._get_search_document_query(search, weights)
+        if not tsquery:
+            return self.browse()
+        query = self._where_calc(domain or [])
+        self._apply_ir_rules(query, 'read')
+        query.add_where('"helpdesk_ticket".search_document @@ to_tsquery(%s, %s)', [SEARCH_DOCUMENT_CONFIG, tsquery])
+        ticket_query, ticket_params = query.subselect()
+        self.env.cr.execute("""
+              SELECT id
+                FROM helpdesk_ticket
+               WHERE id IN ({ticket_query})
+            ORDER BY ts_rank(search_document, to_tsquery(%s, %s)) DESC, id DESC
+               LIMIT %s
+              OFFSET %s
+        """.format(ticket_query=ticket_query), list(ticket_params) + [SEARCH_DOCUMENT_CONFIG, tsquery, limit, offset or 0])
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    def _update_search_document(self, all_tickets=False):
+        """ Build the search document of the tickets from their subject, their description and their discussion
+            messages, converted to plain text (without their HTML tags and entities)
+            :param all_tickets: build the search document of all the tickets, instead of the current ones
+        """
+        if not self and not all_tickets:
+            return
+        self.flush(['name', 'description'])
+        self.env['mail.message'].flush(['model', 'res_id', 'subtype_id', 'body'])
+        if all_tickets:
+            self.env.cr.execute("SELECT id FROM helpdesk_ticket")
+            ticket_ids = [row[0] for row in self.env.cr.fetchall()]
+        else:
+            ticket_ids = self.ids
+        subtype_id = self.env['ir.model.data']._xmlid_to_res_id('mail.mt_comment')
+        for batch_ids in split_every(SEARCH_DOCUMENT_BATCH_SIZE, ticket_ids, tuple):
+            self.env.cr.execute("SELECT id, name, description FROM helpdesk_ticket WHERE id IN %s", (batch_ids,))
+            documents = {
+                ticket_id: (name or '', html2plaintext(description or ''), [])
+                for ticket_id, name, description in self.env.cr.fetchall()
+            }
+            self.env.cr.execute("""
+                  SELECT res_id, body
+                    FROM mail_message
+                   WHERE model = 'helpdesk.ticket' AND res_id IN %s AND subtype_id = %s
+                ORDER BY id
+            """, (batch_ids, subtype_id))
+            for ticket_id, body in self.env.cr.fetchall():
+                documents[ticket_id][2].append(html2plaintext(body or ''))
+            if not documents:
+                continue
+            self.env.cr.execute("""
+                UPDATE helpdesk_ticket ticket
+                   SET search_document = setweight(to_tsvector(%(config)s, document.subject), %(subject)s)
+                                      || setweight(to_tsvector(%(config)s, document.description), %(description)s)
+                                      || setweight(to_tsvector(%(config)s, document.message), %(message)s)
+                  FROM unnest(%(ids)s, %(subjects)s, %(descriptions)s, %(messages)s)
+                       AS document(id, subject, description, message)
+                 WHERE ticket.id = document.id
+            """, {
+                'config': SEARCH_DOCUMENT_CONFIG,
+                'subject': SEARCH_WEIGHT_SUBJECT,
+                'description': SEARCH_WEIGHT_DESCRIPTION,
+                'message': SEARCH_WEIGHT_MESSAGE,
+                'ids': list(documents),
+                'subjects': [subject for subject, dummy, dummy in documents.values()],
+                'descriptions': [description for dummy, description, dummy in documents.values()],
+                'messages': [' '.join(messages) for dummy, dummy, messages in documents.values()],
+            })
+
+    def _get_open_ticket_load(self):
+        """ Count the current open tickets per team member, as maintained in `helpdesk.team.load`
+            :returns a Counter (team_id, user_id) -> number of open tickets
+        """
+        return Counter(
+            (ticket.team_id.id, ticket.user_id.id) for ticket in self
+            if ticket.active and ticket.team_id and ticket.user_id and ticket.stage_id and not ticket.is_closed
+        )
+
+    def _get_team_stats(self):
+        """ Count the tickets in the statistics of their team, as maintained in `helpdesk.team.stats`: the open
+            tickets, the unassigned ones, and the ones with an SLA deadline, per date from which they are counted
+            as failing soon (the deadline is before the end of that day).
+            :returns a Counter (team_id, counter, deadline date) -> number of tickets
+        """
+        stats = Counter()
+        for ticket in self:
+            if not ticket.active or not ticket.team_id:
+                continue
+            if ticket.stage_id and not ticket.is_closed:
+                stats[(ticket.team_id.id, 'open_ticket_count', False)] += 1
+                if not ticket.user_id:
+                    stats[(ticket.team_id.id, 'unassigned_ticket_count', False)] += 1
+            if ticket.sla_deadline:
+                deadline_date = (ticket.sla_deadline - relativedelta(seconds=1)).date()
+                stats[(ticket.team_id.id, 'sla_deadline', deadline_date)] += 1
+        return stats
+
+    def _get_dashboard_stats(self, ratings=None, sla_now=None):
+        """ Contribution of the tickets to the dashboard statistics of their assigned user, with the same rules
+            as `helpdesk.team._compute_dashboard_data`: the open tickets per priority with their open hours and
+            failed SLA, the tickets closed today and in the last 7 days with their failed SLA and ratings.
+            :param ratings: only count the grades of these ratings of the tickets, and nothing else
+            :param sla_now: the datetime the SLA deadlines of the open tickets are compared with, now by default
+            :returns a dict (user_id, company_id) -> Counter (section, key) -> value
+        """
+        now = fields.Datetime.now()
+        sla_now = sla_now or now
+        # the closed tickets of today are counted from the beginning of the day in the timezone of the user of the
+        # dashboard, not the one of the current user, and their ratings from the beginning of the day of the server
+        today_per_user = {}
+        rating_today = fields.Datetime.to_datetime(fields.Date.today())
+        seven_days = fields.Datetime.to_datetime(fields.Date.today() - relativedelta(days=6))
+        if ratings is not None:
+            ratings_per_ticket = defaultdict(list)
+            for rating in ratings:
+                ratings_per_ticket[rating.res_id].append(rating)
+        stats = defaultdict(Counter)
+        for ticket in self:
+            if not ticket.active or not ticket.user_id or not ticket.stage_id:
+                continue
+            user_stats = stats[(ticket.user_id.id, ticket.company_id.id)]
+            if not ticket.is_closed:
+                failed = int(bool((ticket.sla_deadline and ticket.sla_deadline < sla_now) or ticket.sla_reached_late))
+                if ratings is not None:
+                    continue
+                hours = int(((ticket.close_date or now) - ticket.create_date).total_seconds() / 3600)
+                for section in ['my_all'] + {'2': ['my_high'], '3': ['my_urgent']}.get(ticket.priority, []):
+                    user_stats[(section, 'count')] += 1
+                    user_stats[(section, 'hours_total')] += hours
+                    user_stats[(section, 'failed')] += failed
+                continue
+            if not ticket.close_date or ticket.close_date < seven_days:
+                continue
+            # the closed tickets only fail the SLA they reached late
+            failed = int(ticket.sla_reached_late)
+            if ratings is None:
+                user = ticket.user_id
+                if user.id not in today_per_user:
+                    today_per_user[user.id] = fields.Datetime.to_datetime(
+                        fields.Date.context_today(self.with_user(user).with_context(tz=user.tz)))
+                for section in ['7days', 'today'] if ticket.close_date >= today_per_user[user.id] else ['7days']:
+                    user_stats[(section, 'count')] += 1
+                    user_stats[(section, 'failed')] += failed
+            ticket_ratings = ticket.rating_ids if ratings is None else ratings_per_ticket[ticket.id]
+            for section in ['7days', 'today'] if ticket.close_date >= rating_today else ['7days']:
+                for rating in ticket_ratings:
+                    if not rating.consumed or rating.rating < 1:
+                        continue
+                    if rating.rating >= rating_model.RATING_LIMIT_SATISFIED:
+                        user_stats[(section, 'great')] += 1
+                    elif rating.rating >= rating_model.RATING_LIMIT_OK:
+                        user_stats[(section, 'okay')] += 1
+                    else:
+                        user_stats[(section, 'bad')] += 1
+        return stats
+
     @api.model
     def _sla_reset_trigger(self):
         """ Get the list of field for which we have to reset the SLAs (regenerate) """
         return ['team_id', 'priority', 'ticket_type_id', 'tag_ids', 'partner_id']
 
     def _sla_apply(self, keep_reached=False):
-        """ Apply SLA to current tickets: erase the current SLAs, then find and link the new SLAs to each ticket.
+        """ Apply SLA to current tickets: reconcile their SLA status with the SLA to apply. Only the status of the
+            newly matched SLAs are created and only the ones of the SLAs no longer matched are removed, so the
+            other status (and their deadline and exceeded days) are left untouched.
             Note: transferring ticket to a team "not using SLA" (but with SLAs defined), SLA status of the ticket will be
             erased but nothing will be recreated.
+            :param keep_reached: keep the reached status of the SLAs no longer matched, to avoid losing reached_date info
             :returns recordset of new helpdesk.sla.status applied on current tickets
         """
         # get SLA to apply
-        sla_per_tickets = self._sla_find()
+        sla_per_ticket = {}
+        for tickets, slas in self._sla_find().items():
+            sla_per_ticket.update(dict.fromkeys(tickets.ids, slas))
+
+        sla_status_to_remove = self.env['helpdesk.sla.status']
+        tickets_per_missing_slas = {}
+        for ticket in self:
+            slas = sla_per_ticket.get(ticket.id, self.env['helpdesk.sla'])
+            statuses = ticket.sla_status_ids
+            sla_status_to_remove |= statuses.filtered(
+                lambda status: status.sla_id not in slas and not (keep_reached and status.reached_datetime))
+            missing_slas = slas - statuses.sla_id
+            if missing_slas:
+                tickets_per_missing_slas.setdefault(missing_slas, self.env['helpdesk.ticket'])
+                tickets_per_missing_slas[missing_slas] |= ticket
 
         # generate values of new sla status
         sla_status_value_list = []
-        for tickets, slas in sla_per_tickets.items():
-            sla_status_value_list += tickets._sla_generate_status_values(slas, keep_reached=keep_reached)
-
-        sla_status_to_remove = self.mapped('sla_status_ids')
-        if keep_reached:  # keep only the reached one to avoid losing reached_date info
-            sla_status_to_remove = sla_status_to_remove.filtered(lambda status: not status.reached_datetime)
-
-        # if we are going to recreate many sla.status, then add norecompute to avoid 2 recomputation (unlink + recreate). Here,
-        # `norecompute` will not trigger recomputation. It will be done on the create multi (if value list is not empty).
-        if sla_status_value_list:
-            sla_status_to_remove.with_context(norecompute=True)
+        for slas, tickets in tickets_per_missing_slas.items():
+            sla_status_value_list += tickets._sla_generate_status_values(slas)
 
-        # unlink status and create the new ones in 2 operations (recomputation optimized)
         sla_status_to_remove.unlink()
-        return self.env['helpdesk.sla.status'].create(sla_status_value_list)
+        sla_status = self.env['helpdesk.sla.status'].create(sla_status_value_list)
+        sla_status._schedule_sla_breach()
+        return sla_status
+
+    def _sla_match_partner(self, partner_paths):
+        """ Return whether the customer of the current ticket matches the customers of a SLA policy, given
+            by their `parent_path`: the policy applies to the customers, their parents and their children.
+        """
+        self.ensure_one()
+        if not partner_paths:
+            return True
+        ticket_path = self.partner_id.parent_path
+        if not ticket_path:
+            return False
+        return any(ticket_path.startswith(path) or path.startswith(ticket_path) for path in partner_paths)
 
     def _sla_find_extra_domain(self):
+        """ Hook to narrow the SLA policies matching the current ticket. The team, priority, type, stage, tags
+            and customers of the policies are matched by the SLA index (see `_sla_find`); a non-empty domain
+            returned here is applied on top of them, with one search per group of similar tickets.
+        """
         self.ensure_one()
-        return [
-            '|', '|', ('partner_ids', 'parent_of', self.partner_id.ids),
-            ('partner_ids', 'child_of', self.partner_id.ids), ('partner_ids', '=', False)
-        ]
+        return []
 
     def _sla_find(self):
-        """ Find the SLA to apply on the current tickets
+        """ Find the SLA to apply on the current tickets, using the SLA index of their teams (no query
+            is done per ticket or group of tickets, unless `_sla_find_extra_domain` is overridden).
             :returns a map with the tickets linked to the SLA to apply on them
             :rtype : dict {<helpdesk.ticket>: <helpdesk.sla>}
         """
         tickets_map = {}
-        sla_domain_map = {}
 
         def _generate_key(ticket):
             """ Return a tuple identifying the combinaison of field determining the SLA to apply on the ticket """
@@ -937,19 +1402,30 @@ class HelpdeskTicket(models.Model):
                 # group the ticket per key
                 tickets_map.setdefault(key, self.env['helpdesk.ticket'])
                 tickets_map[key] |= ticket
-                # group the SLA to apply, by key
-                if key not in sla_domain_map:
-                    sla_domain_map[key] = expression.AND([[
-                        ('team_id', '=', ticket.team_id.id), ('priority', '<=', ticket.priority),
-                        ('stage_id.sequence', '>=', ticket.stage_id.sequence),
-                        '|', ('ticket_type_id', '=', ticket.ticket_type_id.id), ('ticket_type_id', '=', False)],
-                        ticket._sla_find_extra_domain()])
 
+        sla_index = self.env['helpdesk.sla']._get_sla_index(self.team_id.ids)
         result = {}
-        for key, tickets in tickets_map.items():  # only one search per ticket group
-            domain = sla_domain_map[key]
-            slas = self.env['helpdesk.sla'].search(domain)
-            result[tickets] = slas.filtered(lambda s: s.tag_ids <= tickets.tag_ids)  # SLA to apply on ticket subset
+        for key, tickets in tickets_map.items():
+            ticket = tickets[0]
+            ticket_priority = ticket.priority or ''
+            ticket_sequence = ticket.stage_id.sequence
+            tag_mask = sum(1 << tag_id for tag_id in ticket.tag_ids.ids)
+            rules = [
+                rule
+                for priority, priority_rules in sla_index[ticket.team_id.id].items() if priority <= ticket_priority
+                for rule in priority_rules
+                if rule.ticket_type_id in (False, ticket.ticket_type_id.id)
+                and rule.stage_sequence is not None and rule.stage_sequence >= ticket_sequence
+                and not rule.tag_mask & ~tag_mask
+                and ticket._sla_match_partner(rule.partner_paths)
+            ]
+            rules.sort(key=lambda rule: rule.rank)
+            slas = self.env['helpdesk.sla'].browse([rule.sla_id for rule in rules])
+            extra_domain = ticket._sla_find_extra_domain()
+            if slas and extra_domain:
+                matching_sla_ids = set(slas.search(expression.AND([[('id', 'in', slas.ids)], extra_domain])).ids)
+                slas = slas.filtered(lambda sla: sla.id in matching_sla_ids)
+            result[tickets] = slas  # SLA to apply on ticket subset
         return result
 
     def _sla_generate_status_values(self, slas, keep_reached=False):
@@ -971,8 +1447,9 @@ class HelpdeskTicket(models.Model):
                     result.append({
                         'ticket_id': ticket.id,
                         'sla_id': sla.id,
-                        'reached_datetime': fields.Datetime.now() if ticket.stage_id == sla.stage_id else False
+                        'reached_datetime': fields.Datetime.now() if ticket.stage_id == sla.stage_id else False,
                         # in case of SLA on first stage
+                        'freeze_start': fields.Datetime.now() if ticket.stage_id in sla.exclude_stage_ids else False,
                     })
 
         return result
@@ -980,15 +1457,44 @@ class HelpdeskTicket(models.Model):
     def _sla_reach(self, stage_id):
         """ Flag the SLA status of current ticket for the given stage_id as reached, and even the unreached SLA applied
             on stage having a sequence lower than the given one.
+            This is done in a single query, then only the fields depending on the reached date of the flagged status
+            are marked to be recomputed (in batch, at the next flush).
+            :returns recordset of the helpdesk.sla.status flagged as reached
         """
+        # the status are updated in SQL: check the access rights the ORM would check
+        self.env['helpdesk.sla.status'].check_access_rights('write')
+        team_ids = self.mapped('team_id').ids
+        if not self.ids or not team_ids:
+            return self.env['helpdesk.sla.status']
         stage = self.env['helpdesk.stage'].browse(stage_id)
-        stages = self.env['helpdesk.stage'].search([('sequence', '<=', stage.sequence), (
-            'team_ids', 'in', self.mapped('team_id').ids)])  # take previous stages
-        self.env['helpdesk.sla.status'].search([
-            ('ticket_id', 'in', self.ids),
-            ('sla_stage_id', 'in', stages.ids),
-            ('reached_datetime', '=', False),
-        ]).write({'reached_datetime': fields.Datetime.now()})
+        self.env['helpdesk.sla.status'].flush(['ticket_id', 'sla_stage_id', 'reached_datetime'])
+        now = fields.Datetime.now()
+        self.env.cr.execute("""
+            UPDATE helpdesk_sla_status
+               SET reached_datetime = %(now)s, write_uid = %(uid)s, write_date = %(now)s
+             WHERE ticket_id IN %(ticket_ids)s
+               AND reached_datetime IS NULL
+               AND sla_stage_id IN (
+                    SELECT stage.id
+                      FROM helpdesk_stage stage
+                      JOIN team_stage_rel rel ON rel.helpdesk_stage_id = stage.id
+                     WHERE stage.active
+                       AND stage.sequence <= %(sequence)s
+                       AND rel.helpdesk_team_id IN %(team_ids)s
+               )
+         RETURNING id
+        """, {
+            'now': now,
+            'uid': self.env.uid,
+            'ticket_ids': tuple(self.ids),
+            'sequence': stage.sequence,
+            'team_ids': tuple(team_ids),
+        })
+        statuses = self.env['helpdesk.sla.status'].browse([row[0] for row in self.env.cr.fetchall()])
+        if statuses:
+            statuses.invalidate_cache(['reached_datetime', 'write_uid', 'write_date'], statuses.ids)
+            statuses.modified(['reached_datetime'])
+        return statuses
 
     def assign_ticket_to_self(self):
         self.ensure_one()
@@ -1069,8 +1575,35 @@ class HelpdeskTicket(models.Model):
                     ('partner_id', '=', False),
                     ('partner_email', '=', new_partner.email),
                     ('stage_id.fold', '=', False)]).write({'partner_id': new_partner.id})
+
+        if message.subtype_id == self.env.ref('mail.mt_comment'):
+            self._add_last_message(message)
         return super(HelpdeskTicket, self)._message_post_after_hook(message, msg_vals)
 
+    def _add_last_message(self, message):
+        """ Keep the author of the last discussion message of the tickets, and add the message to their search
+            document, in one query. Updated in SQL, so that a message does not count as an update of the tickets
+            (e.g. for their automatic closing).
+        """
+        if not self:
+            return
+        self.flush(['partner_id', 'last_message_author_id', 'last_message_is_customer'])
+        self.env.cr.execute("""
+            UPDATE helpdesk_ticket
+               SET last_message_author_id = %(author_id)s,
+                   last_message_is_customer = %(author_id)s IS NOT NULL AND partner_id IS NOT DISTINCT FROM %(author_id)s,
+                   search_document = COALESCE(search_document, ''::tsvector)
+                                  || setweight(to_tsvector(%(config)s, %(body)s), %(weight)s)
+             WHERE id IN %(ids)s
+        """, {
+            'author_id': message.author_id.id or None,
+            'config': SEARCH_DOCUMENT_CONFIG,
+            'body': html2plaintext(message.body or ''),
+            'weight': SEARCH_WEIGHT_MESSAGE,
+            'ids': tuple(self.ids),
+        })
+        self.invalidate_cache(['last_message_author_id', 'last_message_is_customer'], self.ids)
+
     def _track_template(self, changes):
         res = super(HelpdeskTicket, self)._track_template(changes)
         ticket = self[0]
@@ -1227,7 +1760,7 @@ class HelpdeskTicketCategories(models.Model):
         action = self.action_view_ticket()
         action.update({
             'display_name': _("Tickets"),
-            'domain': [('team_id', '=', self.id), ('stage_id.is_close', '=', False)],
+            'domain': [('team_id', '=', self.id), ('is_closed', '=', False)],
         })
         return action
 
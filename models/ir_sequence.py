@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+
+from odoo import api, models
+
+_logger = logging.getLogger(__name__)
+
+
+class IrSequence(models.Model):
+    _inherit = 'ir.sequence'
+
+    @api.model
+    def _next_by_code_batch(self, sequence_code, count, sequence_date=None):
+        """ Batched version of `next_by_code`: reserve `count` numbers of the sequence. The numbers of the standard
+            sequences are taken from their PostgreSQL sequence in a single query; the "no gap" sequences and the
+            ones using date ranges fall back on `_next`, number per number.
+            :returns the list of the `count` next values of the sequence (or of False if there is no sequence)
+        """
+        self.check_access_rights('read')
+        if count <= 0:
+            return []
+        company_id = self.env.company.id
+        seq_ids = self.search([('code', '=', sequence_code), ('company_id', 'in', [company_id, False])], order='company_id')
+        if not seq_ids:
+            _logger.debug("No ir.sequence has been found for code '%s'. Please make sure a sequence is set for current company." % sequence_code)
+            return [False] * count
+        seq_id = seq_ids[0]
+        if seq_id.implementation != 'standard' or seq_id.use_date_range:
+            return [seq_id._next(sequence_date=sequence_date) for dummy in range(count)]
+        self.env.cr.execute("SELECT nextval(%s) FROM generate_series(1, %s)", ('ir_sequence_%03d' % seq_id.id, count))
+        numbers = sorted(number for number, in self.env.cr.fetchall())
+        return [seq_id.get_next_char(number) for number in numbers]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo import models
+
+
+class MailMessage(models.Model):
+    _inherit = 'mail.message'
+
+    def write(self, vals):
+        update_search_document = any(field_name in vals for field_name in ['body', 'subtype_id', 'model', 'res_id'])
+        if update_search_document:
+            tickets_before = self._get_helpdesk_tickets()
+        res = super(MailMessage, self).write(vals)
+        if update_search_document:
+            (tickets_before | self._get_helpdesk_tickets())._update_search_document()
+        return res
+
+    def unlink(self):
+        # the messages of the tickets being deleted are deleted with them: no search document to rebuild
+        tickets = self._get_helpdesk_tickets() - self.env['helpdesk.ticket'].sudo().browse(
+            self.env.context.get('helpdesk_unlink_ticket_ids', []))
+        res = super(MailMessage, self).unlink()
+        tickets._update_search_document()
+        return res
+
+    def _get_helpdesk_tickets(self):
+        """ The discussion messages of the tickets are part of their search document """
+        ticket_ids = [message.res_id for message in self.sudo() if message.model == 'helpdesk.ticket' and message.res_id]
+        return self.env['helpdesk.ticket'].sudo().browse(ticket_ids).exists()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo import api, models
+
+
+class Rating(models.Model):
+    _inherit = 'rating.rating'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        ratings = super(Rating, self).create(vals_list)
+        ratings._invalidate_helpdesk_dashboard()
+        self.env['helpdesk.team']._notify_dashboard(ratings._get_helpdesk_dashboard_stats())
+        return ratings
+
+    def write(self, vals):
+        update_dashboard = any(field_name in vals for field_name in ['rating', 'consumed', 'res_model', 'res_id'])
+        if update_dashboard:
+            dashboard_before = self._get_helpdesk_dashboard_stats()
+        res = super(Rating, self).write(vals)
+        if update_dashboard:
+            self._invalidate_helpdesk_dashboard()
+            self.env['helpdesk.team']._notify_dashboard(self._get_helpdesk_dashboard_stats(), dashboard_before)
+        return res
+
+    def unlink(self):
+        self._invalidate_helpdesk_dashboard()
+        self.env['helpdesk.team']._notify_dashboard({}, self._get_helpdesk_dashboard_stats())
+        return super(Rating, self).unlink()
+
+    def _get_helpdesk_tickets(self):
+        ticket_ids = [rating.res_id for rating in self.sudo() if rating.res_model == 'helpdesk.ticket']
+        return self.env['helpdesk.ticket'].sudo().browse(ticket_ids).exists()
+
+    def _get_helpdesk_dashboard_stats(self):
+        """ Contribution of the ratings to the dashboard statistics of the users assigned to their tickets """
+        ratings = self.sudo().filtered(lambda rating: rating.res_model == 'helpdesk.ticket')
+        return self._get_helpdesk_tickets()._get_dashboard_stats(ratings=ratings)
+
+    def _invalidate_helpdesk_dashboard(self):
+        """ The ratings of the tickets are shown on the dashboard of their assigned user """
+        tickets = self._get_helpdesk_tickets()
+        if tickets:
+            self.env['helpdesk.team']._invalidate_dashboard_cache(set(tickets.user_id.ids))
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timedelta
+
+from odoo import models
+from odoo.addons.resource.models.resource import make_aware
+
+
+class WorkingTimeline(object):
+    """ In-memory timeline of the working intervals of a calendar.
+
+        The intervals are fetched from the calendar by chunks, only once, and
+        kept sorted so that any instant can be located with a binary search.
+        ``plan_days`` and ``plan_hours`` mirror the methods of the same name on
+        ``resource.calendar`` (same 14-day windows, same arithmetic), so they
+        return exactly the same datetimes without querying the calendar again.
+    """
+    CHUNK = timedelta(days=56)
+    WINDOW = timedelta(days=14)
+
+    def __init__(self, calendar, start_dt, compute_leaves=True):
+        self.calendar = calendar
+        self.compute_leaves = compute_leaves
+        start_dt = make_aware(start_dt)[0]
+        self._start = self._stop = start_dt
+        self._intervals = []  # list of (start, stop) tuples, sorted and merged
+        self._stops = []  # stop of each interval, for the binary search
+
+    def _get_intervals(self, start_dt, end_dt):
+        if self.compute_leaves:
+            return self.calendar._work_intervals_batch(start_dt, end_dt)[False]
+        return self.calendar._attendance_intervals_batch(start_dt, end_dt)[False]
+
+    def _fetch(self, start_dt, end_dt):
+        """ Return the merged intervals of the calendar between the given datetimes """
+        result = []
+        for start, stop, _meta in self._get_intervals(start_dt, end_dt):
+            if result and result[-1][1] == start:
+                result[-1] = (result[-1][0], stop)
+            else:
+                result.append((start, stop))
+        return result
+
+    def _ensure(self, start_dt, end_dt):
+        """ Make sure the timeline covers [start_dt, end_dt] """
+        if start_dt < self._start:
+            before = self._fetch(start_dt, self._start)
+            if before and self._intervals and before[-1][1] == self._intervals[0][0]:
+                self._intervals[0] = (before.pop()[0], self._intervals[0][1])
+            self._intervals[:0] = before
+            self._start = start_dt
+        while self._stop < end_dt:
+            stop = max(self._stop + self.CHUNK, end_dt)
+            after = self._fetch(self._stop, stop)
+            if after and self._intervals and self._intervals[-1][1] == after[0][0]:
+                self._intervals[-1] = (self._intervals[-1][0], after.pop(0)[1])
+            self._intervals.extend(after)
+            self._stop = stop
+        self._stops = [stop for dummy, stop in self._intervals]
+
+    def _iter_windows(self, day_dt):
+        """ Iterate on the working intervals from `day_dt`, clipped on the same
+            14-day windows as ``resource.calendar.plan_days/plan_hours``.
+        """
+        for n in range(100):
+            window_start = day_dt + self.WINDOW * n
+            window_stop = window_start + self.WINDOW
+            if window_start < self._start or self._stop < window_stop:
+                self._ensure(window_start, window_stop)
+            index = bisect_right(self._stops, window_start)
+            for start, stop in self._intervals[index:]:
+                if start >= window_stop:
+                    break
+                start, stop = max(start, window_start), min(stop, window_stop)
+                if start < stop:
+                    yield start, stop
+
+    def plan_days(self, days, day_dt):
+        if days <= 0:
+            return self.calendar.plan_days(days, day_dt, compute_leaves=self.compute_leaves)
+        day_dt, revert = make_aware(day_dt)
+        found = set()
+        for start, stop in self._iter_windows(day_dt):
+            found.add(start.date())
+            if len(found) == days:
+                return revert(stop)
+        return False
+
+    def plan_hours(self, hours, day_dt):
+        if hours < 0:
+            return self.calendar.plan_hours(hours, day_dt, compute_leaves=self.compute_leaves)
+        day_dt, revert = make_aware(day_dt)
+        for start, stop in self._iter_windows(day_dt):
+            interval_hours = (stop - start).total_seconds() / 3600
+            if hours <= interval_hours:
+                return revert(start + timedelta(hours=hours))
+            hours -= interval_hours
+        return False
+
+
+class ResourceCalendar(models.Model):
+    _inherit = 'resource.calendar'
+
+    def _get_working_timeline(self, start_dt, compute_leaves=True):
+        """ Return a :class:`WorkingTimeline` of the current calendar starting at `start_dt` """
+        self.ensure_one()
+        return WorkingTimeline(self, start_dt, compute_leaves=compute_leaves)
+
+    def _get_work_duration_data_batch(self, periods, compute_leaves=True):
+        """ Batched version of `get_work_duration_data`: the working intervals covering all the periods are
+            expanded once, with the cumulative working time at the start of each of them, so that the working
+            time of any period is found with two binary searches. The working days are computed per day (as
+            quarters of the day total) on the intervals of the first and last days of the period only, the
+            days in between being summed from precomputed values.
+            :param periods: list of (start, end) datetimes
+            :returns list of dict {'days': float, 'hours': float}, one per period
+        """
+        self.ensure_one()
+        periods = [(make_aware(start)[0], make_aware(end)[0]) for start, end in periods]
+        bounds = [period for period in periods if period[0] < period[1]]
+        if not bounds:
+            return [{'days': 0, 'hours': 0} for period in periods]
+        from_datetime = min(start for start, end in bounds)
+        to_datetime = max(end for start, end in bounds)
+
+        day_total = self._get_resources_day_total(from_datetime, to_datetime)[False]
+        if compute_leaves:
+            intervals = list(self._work_intervals_batch(from_datetime, to_datetime)[False])
+        else:
+            intervals = list(self._attendance_intervals_batch(from_datetime, to_datetime)[False])
+
+        starts = [start for start, stop, meta in intervals]
+        stops = [stop for start, stop, meta in intervals]
+        # working time done before each interval
+        cumulated = [timedelta()]
+        for start, stop, meta in intervals:
+            cumulated.append(cumulated[-1] + (stop - start))
+        # working days of each day, and the cumulated working days before each day
+        day_intervals = defaultdict(list)
+        for interval in intervals:
+            day_intervals[interval[0].date()].append(interval)
+        days = sorted(day_intervals)
+        cumulated_days = [0]
+        for day in days:
+            cumulated_days.append(cumulated_days[-1] + self._get_days_data(day_intervals[day], day_total)['days'])
+
+        def worked_until(dt):
+            index = bisect_right(stops, dt)
+            worked = cumulated[index]
+            if index < len(starts) and starts[index] < dt:
+                worked += dt - starts[index]
+            return worked
+
+        def clipped(index, start_dt, end_dt):
+            start, stop, meta = intervals[index]
+            if start < start_dt:
+                start = start_dt.astimezone(start.tzinfo)
+            if stop > end_dt:
+                stop = end_dt.astimezone(stop.tzinfo)
+            return start, stop, meta
+
+        result = []
+        for start_dt, end_dt in periods:
+            first = bisect_right(stops, start_dt)
+            last = bisect_left(starts, end_dt)  # first interval starting after the period
+            period_intervals = [clipped(index, start_dt, end_dt) for index in range(first, last)]
+            period_intervals = [interval for interval in period_intervals if interval[0] < interval[1]]
+            if start_dt >= end_dt or not period_intervals:
+                result.append({'days': 0, 'hours': 0})
+                continue
+            first_day = period_intervals[0][0].date()
+            last_day = period_intervals[-1][0].date()
+            edge_intervals = [interval for interval in period_intervals if interval[0].date() in (first_day, last_day)]
+            worked_days = self._get_days_data(edge_intervals, day_total)['days']
+            if first_day != last_day:
+                # the days in between are fully included in the period
+                worked_days += cumulated_days[bisect_left(days, last_day)] - cumulated_days[bisect_right(days, first_day)]
+            result.append({
+                'days': worked_days,
+                'hours': (worked_until(end_dt) - worked_until(start_dt)).total_seconds() / 3600,
+            })
+        return result
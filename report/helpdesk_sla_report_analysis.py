@@ -49,7 +49,7 @@ class HelpdeskSLAReport(models.Model):
                    T.partner_id,
                    T.company_id,
                    T.priority AS priority,
-                   T.sla_reached_late OR T.sla_deadline < NOW() AT TIME ZONE 'UTC' AS ticket_failed,
+                   T.sla_fail AS ticket_failed,
                    T.sla_deadline AS ticket_deadline,
                    T.close_hours AS ticket_close_hours,
                    EXTRACT(HOUR FROM (COALESCE(T.assign_date, NOW()) - T.create_date)) AS ticket_open_hours,
@@ -61,13 +61,8 @@ class HelpdeskSLAReport(models.Model):
                    ST.deadline AS sla_deadline,
                    ST.reached_datetime AS sla_reached_datetime,
                    ST.exceeded_days AS sla_exceeded_days,
-                   CASE
-                       WHEN ST.reached_datetime IS NOT NULL AND ST.reached_datetime < ST.deadline THEN 'reached'
-                       WHEN ST.reached_datetime IS NOT NULL AND ST.reached_datetime >= ST.deadline THEN 'failed'
-                       WHEN ST.reached_datetime IS NULL AND ST.deadline > NOW() THEN 'ongoing'
-                       ELSE 'failed'
-                   END AS sla_status,
-                   ST.reached_datetime >= ST.deadline OR (ST.reached_datetime IS NULL AND ST.deadline < NOW() AT TIME ZONE 'UTC') AS sla_status_failed
+                   ST.status AS sla_status,
+                   ST.status = 'failed' AS sla_status_failed
         """
         return select_str
 
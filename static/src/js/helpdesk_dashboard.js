@@ -16,6 +16,7 @@ var KanbanRenderer = require('web.KanbanRenderer');
 var KanbanView = require('web.KanbanView');
 var KanbanRecord = require('web.KanbanRecord');
 var session = require('web.session');
+var utils = require('web.utils');
 var view_registry = require('web.view_registry');
 const { format } = require('web.field_utils');
 
@@ -24,6 +25,9 @@ var QWeb = core.qweb;
 var _t = core._t;
 var _lt = core._lt;
 
+// the statistics are fetched again on this delay, as a safety net for the changes not pushed on the bus
+var DASHBOARD_REFRESH_DELAY = 5 * 60 * 1000;
+
 KanbanRecord.include({
     //--------------------------------------------------------------------------
     // Private
@@ -197,6 +201,66 @@ var HelpdeskDashboardModel = KanbanModel.extend({
         return this._loadDashboard(this._super.apply(this, arguments));
     },
 
+    /**
+     * Applies the changes of the dashboard statistics pushed on the bus by the
+     * server (see `helpdesk.team._notify_dashboard`): the counters and totals
+     * are incremented, and the averages and rates computed again from them.
+     *
+     * @param {string} localID
+     * @param {Object} changes the changes of each section of the dashboard,
+     *   e.g. {my_all: {count: 1, hours_total: 2}, today: {great: 1}}
+     * @returns {boolean} true if the dashboard has been updated
+     */
+    applyDashboardChanges: function (localID, changes) {
+        var values = this.dashboardValues[localID];
+        if (!values) {
+            return false;
+        }
+        _.each(changes, function (sectionChanges, section) {
+            var sectionValues = values[section];
+            if (!sectionValues) {
+                return;
+            }
+            _.each(sectionChanges, function (value, key) {
+                sectionValues[key] = (sectionValues[key] || 0) + value;
+            });
+            if ('hours_total' in sectionValues) {
+                sectionValues.hours = utils.round_decimals(sectionValues.hours_total / (sectionValues.count || 1), 2);
+            }
+            if ('failed' in sectionValues && 'success' in sectionValues) {
+                sectionValues.success = utils.round_decimals(
+                    (sectionValues.count - sectionValues.failed) * 100 / (sectionValues.count || 1), 2);
+            }
+            if ('rating' in sectionValues) {
+                // same average as `helpdesk.team._compute_activity_avg`, on 100
+                var great = sectionValues.great || 0;
+                var okay = sectionValues.okay || 0;
+                var total = great + okay + (sectionValues.bad || 0);
+                sectionValues.rating = total ? utils.round_decimals((great * 5 + okay * 3) / total, 2) * 20 : 0;
+            }
+        });
+        return true;
+    },
+    /**
+     * Updates the dashboard values (e.g. the targets of the user), without
+     * fetching them again.
+     *
+     * @param {string} localID
+     * @param {Object} values
+     */
+    updateDashboardValues: function (localID, values) {
+        _.extend(this.dashboardValues[localID], values);
+    },
+    /**
+     * Fetches the dashboard statistics again, without loading the teams.
+     *
+     * @param {string} localID
+     * @returns {Promise}
+     */
+    refreshDashboard: function (localID) {
+        return this._loadDashboard(Promise.resolve(localID));
+    },
+
     //--------------------------------------------------------------------------
     // Private
     //--------------------------------------------------------------------------
@@ -227,6 +291,26 @@ var HelpdeskDashboardController = KanbanController.extend({
         dashboard_edit_target: '_onDashboardEditTarget',
     }),
 
+    /**
+     * Listens to the changes of the dashboard statistics pushed on the bus,
+     * and fetches them again from time to time.
+     *
+     * @override
+     */
+    start: function () {
+        this.call('bus_service', 'onNotification', this, this._onNotification);
+        this.call('bus_service', 'startPolling');
+        this.refreshInterval = setInterval(this._onRefreshDashboard.bind(this), DASHBOARD_REFRESH_DELAY);
+        return this._super.apply(this, arguments);
+    },
+    /**
+     * @override
+     */
+    destroy: function () {
+        clearInterval(this.refreshInterval);
+        this._super.apply(this, arguments);
+    },
+
     //--------------------------------------------------------------------------
     // Handlers
     //--------------------------------------------------------------------------
@@ -263,7 +347,11 @@ var HelpdeskDashboardController = KanbanController.extend({
             model: 'res.users',
             method: 'write',
             args: [[session.uid], values],
-        }).then(this.reload.bind(this));
+        }).then(() => {
+            // only the target changed: no need to load the dashboard and the teams again
+            this.model.updateDashboardValues(this.handle, values);
+            return this.update({}, {reload: false});
+        });
     },
     /**
      * @private
@@ -288,6 +376,33 @@ var HelpdeskDashboardController = KanbanController.extend({
         }
         return this.do_action(action_name);
     },
+    /**
+     * @private
+     * @param {Object[]} notifications
+     */
+    _onNotification: function (notifications) {
+        var updated = false;
+        // only the changes of the tickets of the companies shown on the dashboard apply
+        var companyIds = session.user_context.allowed_company_ids;
+        for (const { payload, type } of notifications) {
+            if (type !== 'helpdesk.dashboard/update') {
+                continue;
+            }
+            if (companyIds && payload.company_id && !_.contains(companyIds, payload.company_id)) {
+                continue;
+            }
+            updated = this.model.applyDashboardChanges(this.handle, payload.changes) || updated;
+        }
+        if (updated) {
+            this.update({}, {reload: false});
+        }
+    },
+    /**
+     * @private
+     */
+    _onRefreshDashboard: function () {
+        this.model.refreshDashboard(this.handle).then(() => this.update({}, {reload: false}));
+    },
 });
 
 var HelpdeskDashboardView = KanbanView.extend({
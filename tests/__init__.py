@@ -3,5 +3,7 @@
 
 from . import test_helpdesk_flow
 from . import test_helpdesk_sla
+from . import test_helpdesk_sla_benchmark
+from . import test_helpdesk_ticket_benchmark
 from . import test_ui
 from . import test_doc_links
\ No newline at end of file
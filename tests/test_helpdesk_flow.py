@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import patch
+
 from dateutil.relativedelta import relativedelta
 
 from .common import HelpdeskCommon
 from odoo import fields
+from odoo.addons.helpdesk.controllers.portal import CustomerPortal
 from odoo.exceptions import AccessError
 
 
@@ -164,6 +170,24 @@ class TestHelpdeskFlow(HelpdeskCommon):
         self.assertEqual(self.env['helpdesk.ticket'].search_count([('user_id', '=', self.helpdesk_user.id)]), 5)
         self.assertEqual(self.env['helpdesk.ticket'].search_count([('user_id', '=', self.helpdesk_manager.id)]), 5)
 
+    def test_team_assignation_randomly_batch(self):
+        self.test_team.member_ids = [(6, 0, [self.helpdesk_user.id, self.helpdesk_manager.id])]
+        self.test_team.assign_method = 'randomly'
+        first_user = self.env['helpdesk.ticket'].with_context(default_team_id=self.test_team.id).default_get(['user_id'])['user_id']
+        # peeking at the next user to assign does not advance the round-robin
+        self.assertEqual(self.env['helpdesk.ticket'].with_context(default_team_id=self.test_team.id).default_get(['user_id'])['user_id'], first_user)
+        # tickets created in batch are distributed among the members
+        tickets = self.env['helpdesk.ticket'].create([{
+            'name': 'test ticket %s' % i,
+            'team_id': self.test_team.id,
+        } for i in range(9)])
+        self.assertEqual(tickets[0].user_id.id, first_user)
+        self.assertEqual(len(tickets.filtered(lambda ticket: ticket.user_id == self.helpdesk_user)), 5 if first_user == self.helpdesk_user.id else 4)
+        self.assertTrue(all(ticket.user_id != next_ticket.user_id for ticket, next_ticket in zip(tickets, tickets[1:])))
+        # the next ticket continues the round-robin
+        ticket = self.env['helpdesk.ticket'].create({'name': 'test ticket', 'team_id': self.test_team.id})
+        self.assertNotEqual(ticket.user_id, tickets[-1].user_id)
+
     def test_team_assignation_balanced(self):
         # we put the helpdesk user and manager in the test_team's members
         self.test_team.member_ids = [(6, 0, [self.helpdesk_user.id, self.helpdesk_manager.id])]
@@ -193,6 +217,134 @@ class TestHelpdeskFlow(HelpdeskCommon):
         self.assertEqual(self.env['helpdesk.ticket'].search_count([('user_id', '=', self.helpdesk_user.id), ('close_date', '=', False)]), 3)
         self.assertEqual(self.env['helpdesk.ticket'].search_count([('user_id', '=', self.helpdesk_manager.id), ('close_date', '=', False)]), 3)
 
+    def test_team_assignation_balanced_batch(self):
+        self.test_team.member_ids = [(6, 0, [self.helpdesk_user.id, self.helpdesk_manager.id])]
+        self.test_team.assign_method = 'balanced'
+        Ticket = self.env['helpdesk.ticket']
+        Ticket.create([{'name': 'test ticket %s' % i, 'team_id': self.test_team.id} for i in range(4)])
+        self.assertEqual(Ticket.search_count([('user_id', '=', self.helpdesk_user.id)]), 2)
+        self.assertEqual(Ticket.search_count([('user_id', '=', self.helpdesk_manager.id)]), 2)
+
+        # helpdesk user finishes his 2 tickets: the 4 new tickets fill his load first
+        Ticket.search([('user_id', '=', self.helpdesk_user.id)]).write({'stage_id': self.stage_done.id})
+        Ticket.create([{'name': 'test ticket %s' % i, 'team_id': self.test_team.id} for i in range(4)])
+        load = self.env['helpdesk.team.load']._get_load(self.test_team.ids)[self.test_team.id]
+        self.assertEqual(load, {self.helpdesk_user.id: 3, self.helpdesk_manager.id: 3})
+
+        # the closed tickets are open again when their stage is no more a closing stage
+        self.stage_done.is_close = False
+        load = self.env['helpdesk.team.load']._get_load(self.test_team.ids)[self.test_team.id]
+        self.assertEqual(load, {self.helpdesk_user.id: 5, self.helpdesk_manager.id: 3})
+
+        # the counters match the tickets
+        Ticket.search([('user_id', '=', self.helpdesk_manager.id)], limit=1).unlink()
+        Ticket.search([('user_id', '=', self.helpdesk_manager.id)], limit=1).write({'user_id': self.helpdesk_user.id})
+        expected = dict(self.env['helpdesk.team.load']._get_load(self.test_team.ids)[self.test_team.id])
+        self.env['helpdesk.team.load']._rebuild()
+        self.assertEqual(self.env['helpdesk.team.load']._get_load(self.test_team.ids)[self.test_team.id], expected)
+        self.assertEqual(expected, {self.helpdesk_user.id: 6, self.helpdesk_manager.id: 1})
+
+    def test_ticket_number_batch(self):
+        sequence = self.env['ir.sequence'].create({
+            'name': 'Helpdesk Ticket',
+            'code': 'helpdesk.ticket',
+            'implementation': 'standard',
+            'number_next': 100,
+        })
+        tickets = self.env['helpdesk.ticket'].create([{'name': 'test ticket %s' % i, 'team_id': self.test_team.id} for i in range(5)])
+        self.assertEqual(tickets.mapped('ticket_number'), [100, 101, 102, 103, 104], 'Numbers should be reserved in order for the batch')
+        ticket = self.env['helpdesk.ticket'].create({'name': 'test ticket', 'team_id': self.test_team.id})
+        self.assertEqual(ticket.ticket_number, 105)
+
+        # no gap sequences are incremented number per number
+        sequence.write({'implementation': 'no_gap', 'number_next': sequence.number_next_actual})
+        tickets = self.env['helpdesk.ticket'].create([{'name': 'test ticket %s' % i, 'team_id': self.test_team.id} for i in range(2)])
+        self.assertEqual(tickets.mapped('ticket_number'), [106, 107])
+
+    def test_ticket_number_display(self):
+        ticket = self.env['helpdesk.ticket'].create({'name': 'test ticket', 'team_id': self.test_team.id})
+        self.assertEqual(ticket.ticket_number_display, 'TN%d-%s-%s' % (ticket.id, ticket.create_date.strftime('%Y%m%d'), '{:,}'.format(ticket.id)))
+        self.assertEqual(self.env['helpdesk.ticket']._get_ticket_by_ref(ticket.ticket_number_display), ticket)
+        self.assertFalse(self.env['helpdesk.ticket']._get_ticket_by_ref('TN0-20190101-0'))
+
+        # the reference is based on the creation date, not on the date of its computation
+        self._utils_set_create_date(ticket, '2019-01-08 09:00:00')
+        ticket.invalidate_cache(['create_date'], ticket.ids)
+        ticket._compute_ticket_number_display()
+        self.assertEqual(ticket.ticket_number_display, 'TN%d-20190108-%s' % (ticket.id, '{:,}'.format(ticket.id)))
+
+    def test_ticket_partners_batch(self):
+        """ Customers given by name and email are found or created once for the whole batch """
+        existing = self.env['res.partner'].create({'name': 'Existing Customer', 'email': 'existing@example.com'})
+        Partner = self.env['res.partner']
+        partner_count = Partner.search_count([])
+        tickets = self.env['helpdesk.ticket'].create([{
+            'name': 'test ticket 1',
+            'team_id': self.test_team.id,
+            'partner_name': 'New Customer',
+            'partner_email': 'New Customer <new@example.com>',
+        }, {
+            'name': 'test ticket 2',
+            'team_id': self.test_team.id,
+            'partner_name': 'New Customer',
+            'partner_email': 'NEW@example.com',
+        }, {
+            'name': 'test ticket 3',
+            'team_id': self.test_team.id,
+            'partner_name': 'Existing Customer',
+            'partner_email': 'Existing@Example.com',
+        }])
+        self.assertEqual(Partner.search_count([]), partner_count + 1, 'Only the unknown customer should be created')
+        self.assertEqual(tickets[0].partner_id, tickets[1].partner_id)
+        self.assertEqual(tickets[0].partner_id.name, 'New Customer')
+        self.assertEqual(tickets[0].partner_id.email, 'new@example.com')
+        self.assertEqual(tickets[0].partner_id.company_id, self.test_team.company_id)
+        self.assertEqual(tickets[2].partner_id, existing)
+
+    def test_ticket_followers_tokens_batch(self):
+        """ The customers follow their tickets and the tickets get their access token, for the whole batch """
+        customer = self.env['res.partner'].create({'name': 'Customer', 'email': 'customer@example.com'})
+        tickets = self.env['helpdesk.ticket'].create([{
+            'name': 'test ticket %s' % i,
+            'team_id': self.test_team.id,
+            'partner_id': customer.id,
+        } for i in range(3)] + [{'name': 'test ticket without customer', 'team_id': self.test_team.id}])
+        for ticket in tickets[:3]:
+            self.assertIn(customer, ticket.message_partner_ids)
+            follower = ticket.message_follower_ids.filtered(lambda follower: follower.partner_id == customer)
+            self.assertEqual(follower.subtype_ids, self.env['mail.message.subtype'].default_subtypes('helpdesk.ticket')[2])
+        self.assertNotIn(customer, tickets[3].message_partner_ids)
+        self.assertTrue(all(tickets.mapped('access_token')))
+        self.assertEqual(len(set(tickets.mapped('access_token'))), 4)
+
+        # subscribing again does not duplicate the followers
+        tickets._message_subscribe_customers()
+        self.assertEqual(self.env['mail.followers'].search_count([
+            ('res_model', '=', 'helpdesk.ticket'), ('res_id', 'in', tickets.ids), ('partner_id', '=', customer.id)]), 3)
+
+    def test_auto_close_tickets(self):
+        self.test_team.write({
+            'auto_close_ticket': True,
+            'auto_close_day': 7,
+            'from_stage_ids': [(6, 0, [self.stage_new.id, self.stage_progress.id])],
+            'to_stage_id': self.stage_done.id,
+        })
+        tickets = self.env['helpdesk.ticket'].create([{
+            'name': 'test ticket %s' % i,
+            'team_id': self.test_team.id,
+            'stage_id': stage.id,
+        } for i, stage in enumerate([self.stage_new, self.stage_progress, self.stage_new, self.stage_cancel])])
+        tickets.flush()
+        # the last ticket is not inactive
+        old_date = fields.Datetime.now() - relativedelta(days=8)
+        self.env.cr.execute("UPDATE helpdesk_ticket SET write_date = %s WHERE id IN %s", (old_date, tuple(tickets[:2].ids + tickets[3:].ids)))
+        tickets.invalidate_cache()
+
+        self.env['helpdesk.team']._cron_auto_close_tickets(chunk_size=1)
+        self.assertEqual([ticket.stage_id for ticket in tickets], [self.stage_done, self.stage_done, self.stage_new, self.stage_cancel])
+        self.assertEqual(self.env['ir.config_parameter'].sudo().get_param('helpdesk.auto_close_last_ticket_id'), '0',
+                         'The next run should start from the first ticket')
+
     def test_create_from_email_multicompany(self):
         company0 = self.env.company
         company1 = self.env['res.company'].create({'name': 'new_company0'})
@@ -446,3 +598,186 @@ Content-Transfer-Encoding: quoted-printable
         self.assertEqual(self.test_team.visibility_member_ids, User)
         tickets = Ticket.with_user(self.helpdesk_user).search([('team_id', '=', self.test_team.id)])
         self.assertTrue(ticket in tickets)
+
+    def test_fcm_notification_outbox(self):
+        """ Notifications are queued at the creation of the tickets, then sent by the worker (one message per
+            token for all the tickets of a user), and scheduled again with a backoff when the server fails """
+        received, statuses = [], [503, 200]
+
+        class FcmStub(BaseHTTPRequestHandler):
+            def do_POST(self):
+                received.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+                self.send_response(statuses.pop(0))
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), FcmStub)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.env['ir.config_parameter'].sudo().set_param(
+            'helpdesk.fcm_endpoint', 'http://127.0.0.1:%s/send' % server.server_port)
+        self.env['fcm.token'].store_fcm_token(self.helpdesk_user.id, 'token-user')
+
+        tickets = self.env['helpdesk.ticket'].create([{
+            'name': 'test ticket %s' % i,
+            'team_id': self.test_team.id,
+            'user_id': self.helpdesk_user.id,
+        } for i in range(3)])
+        notifications = self.env['fcm.notification'].search([('ticket_id', 'in', tickets.ids)])
+        self.assertEqual(len(notifications), 3, 'One notification should be queued per ticket and token')
+        self.assertEqual(set(notifications.mapped('state')), {'pending'})
+        self.assertFalse(received, 'Nothing should be sent at the creation of the tickets')
+
+        Notification = self.env['fcm.notification']
+        with patch.object(type(Notification), '_get_fcm_access_token', lambda self: 'access-token'):
+            Notification._cron_send_notifications()
+            self.assertEqual(len(received), 1, 'The notifications of a token should be sent in a single message')
+            self.assertEqual(received[0]['message']['token'], 'token-user')
+            self.assertEqual(set(notifications.mapped('state')), {'pending'})
+            self.assertEqual(set(notifications.mapped('attempt')), {1})
+            self.assertTrue(all(notification.next_attempt > fields.Datetime.now() for notification in notifications))
+
+            # not sent again before the backoff delay
+            Notification._cron_send_notifications()
+            self.assertEqual(len(received), 1)
+
+            notifications.write({'next_attempt': fields.Datetime.now()})
+            Notification._cron_send_notifications()
+            self.assertEqual(len(received), 2)
+            self.assertEqual(set(notifications.mapped('state')), {'sent'})
+
+    def test_ticket_is_closed(self):
+        tickets = self.env['helpdesk.ticket'].create([{
+            'name': 'test ticket %s' % i,
+            'team_id': self.test_team.id,
+        } for i in range(3)])
+        self.assertEqual(tickets.mapped('is_closed'), [False] * 3)
+
+        tickets[0].write({'stage_id': self.stage_done.id})
+        self.assertEqual(tickets.mapped('is_closed'), [True, False, False])
+
+        # the tickets follow their stage becoming a closing stage, or not
+        self.stage_done.is_close = False
+        self.assertFalse(tickets[0].is_closed)
+        self.stage_new.is_close = True
+        self.assertEqual(tickets.mapped('is_closed'), [False, True, True])
+        self.assertEqual(self.env['helpdesk.ticket'].search([('id', 'in', tickets.ids), ('is_closed', '=', False)]), tickets[0])
+
+    def test_ticket_last_message_author(self):
+        customer = self.env['res.partner'].create({'name': 'Customer', 'email': 'customer@example.com'})
+        ticket = self.env['helpdesk.ticket'].create({
+            'name': 'test ticket',
+            'team_id': self.test_team.id,
+            'partner_id': customer.id,
+        })
+        self.assertFalse(ticket.last_message_author_id)
+        self.assertFalse(ticket.last_message_is_customer)
+
+        ticket.message_post(body='Question', author_id=customer.id, message_type='comment', subtype_xmlid='mail.mt_comment')
+        self.assertEqual(ticket.last_message_author_id, customer)
+        self.assertTrue(ticket.last_message_is_customer)
+
+        # notes are not part of the discussion with the customer
+        ticket.with_user(self.helpdesk_user).message_post(body='Note', message_type='comment', subtype_xmlid='mail.mt_note')
+        self.assertEqual(ticket.last_message_author_id, customer)
+
+        ticket.with_user(self.helpdesk_user).message_post(body='Answer', message_type='comment', subtype_xmlid='mail.mt_comment')
+        self.assertEqual(ticket.last_message_author_id, self.helpdesk_user.partner_id)
+        self.assertFalse(ticket.last_message_is_customer)
+        self.assertEqual(self.env['helpdesk.ticket'].search([('id', '=', ticket.id), ('last_message_author_id', '!=', False), ('last_message_is_customer', '=', False)]), ticket)
+
+        # the author is the customer of the ticket
+        ticket.partner_id = self.helpdesk_user.partner_id
+        self.assertTrue(ticket.last_message_is_customer)
+
+    def test_ticket_fulltext_search(self):
+        Ticket = self.env['helpdesk.ticket']
+        printer, toner = Ticket.create([{
+            'name': 'Printer broken',
+            'team_id': self.test_team.id,
+            'description': '<p>The <b>toner</b> is empty</p>',
+        }, {
+            'name': 'Toner order',
+            'team_id': self.test_team.id,
+        }])
+        message = printer.message_post(body='<p>Replacement cartridge shipped</p>', message_type='comment', subtype_xmlid='mail.mt_comment')
+        printer.message_post(body='<p>Internal note about the invoice</p>', message_type='comment', subtype_xmlid='mail.mt_note')
+
+        # the words in the subject weigh more than the ones in the description
+        self.assertEqual(Ticket._fulltext_search('toner', domain=[('id', 'in', (printer | toner).ids)]), toner | printer)
+        self.assertEqual(Ticket._fulltext_search('toner', domain=[('id', 'in', (printer | toner).ids)], limit=1), toner)
+        # prefix of the words, in the discussion messages only
+        self.assertEqual(Ticket.search([('id', 'in', (printer | toner).ids), ('fulltext_search', 'ilike', 'replac cartri')]), printer)
+        self.assertFalse(Ticket.search([('id', 'in', (printer | toner).ids), ('fulltext_search', 'ilike', 'invoice')]))
+        self.assertFalse(Ticket.search(Ticket._get_fulltext_domain('cartridge', weights='AB') + [('id', '=', printer.id)]))
+        self.assertEqual(Ticket.search(Ticket._get_fulltext_domain('cartridge', weights='C') + [('id', '=', printer.id)]), printer)
+
+        # the subject and the description are searched again when they change, the messages are kept
+        printer.write({'name': 'Scanner broken', 'description': False})
+        self.assertFalse(Ticket._fulltext_search('toner', domain=[('id', '=', printer.id)]))
+        self.assertEqual(Ticket._fulltext_search('scanner cartridge', domain=[('id', '=', printer.id)]), printer)
+
+        # the edited and deleted messages are no longer searched, and the HTML entities are not indexed
+        message.write({'body': '<p>Replacement drum &amp; roller&nbsp;shipped</p>'})
+        self.assertFalse(Ticket._fulltext_search('cartridge', domain=[('id', '=', printer.id)]))
+        self.assertEqual(Ticket._fulltext_search('drum roller', domain=[('id', '=', printer.id)]), printer)
+        self.assertFalse(Ticket._fulltext_search('nbsp', domain=[('id', '=', printer.id)]))
+        self.assertFalse(Ticket._fulltext_search('amp', domain=[('id', '=', printer.id)]))
+        message.unlink()
+        self.assertFalse(Ticket._fulltext_search('drum', domain=[('id', '=', printer.id)]))
+
+    def test_portal_keyset_pagination(self):
+        Ticket = self.env['helpdesk.ticket']
+        tickets = Ticket.create([{
+            'name': 'test ticket %s' % (i % 3),
+            'team_id': self.test_team.id,
+        } for i in range(8)])
+        # equal values and missing values are browsed in the same order as the search
+        tickets[:3].write({'date_last_stage_update': '2019-01-01 10:00:00'})
+        self.env.cr.execute("UPDATE helpdesk_ticket SET date_last_stage_update = NULL WHERE id IN %s", (tuple(tickets[3:5].ids),))
+        tickets.invalidate_cache()
+
+        portal = CustomerPortal()
+        domain = [('id', 'in', tickets.ids)]
+        for order in ['create_date desc, id desc', 'name, id', 'id', 'date_last_stage_update desc, id desc']:
+            expected = Ticket.search(domain, order=order)
+            keyset_order = portal._ticket_keyset_order(order)
+            # forward, by pages of 3 tickets
+            pages = [Ticket.search(domain, order=order, limit=3)]
+            while True:
+                cursor = portal._ticket_keyset_cursor(pages[-1][-1], keyset_order)
+                page = Ticket.search(domain + portal._ticket_keyset_domain(cursor, keyset_order), order=order, limit=3)
+                if not page:
+                    break
+                pages.append(page)
+            self.assertEqual([ticket.id for page in pages for ticket in page], expected.ids, order)
+            # backward, from the last page
+            reverse_order = portal._ticket_keyset_order(order, reverse=True)
+            reverse_order_sql = ', '.join('%s %s' % (field_name, 'asc' if ascending else 'desc') for field_name, ascending in reverse_order)
+            cursor = portal._ticket_keyset_cursor(pages[-1][0], reverse_order)
+            previous_page = Ticket.search(domain + portal._ticket_keyset_domain(cursor, reverse_order), order=reverse_order_sql, limit=3)
+            self.assertEqual(previous_page.ids[::-1], pages[-2].ids, order)
+
+        self.assertIsNone(portal._ticket_keyset_domain('invalid', portal._ticket_keyset_order('id')))
+        # the cursors of a list are not valid in another sorting or with another domain
+        keyset_order = portal._ticket_keyset_order('id')
+        key = portal._ticket_keyset_key('reference', domain)
+        cursor = portal._ticket_keyset_cursor(tickets[0], keyset_order, key)
+        self.assertTrue(portal._ticket_keyset_domain(cursor, keyset_order, key))
+        self.assertIsNone(portal._ticket_keyset_domain(cursor, keyset_order, portal._ticket_keyset_key('date', domain)))
+        self.assertIsNone(portal._ticket_keyset_domain(cursor, keyset_order, portal._ticket_keyset_key('reference', domain + [('user_id', '=', False)])))
+
+    def test_ticket_approximate_count(self):
+        Ticket = self.env['helpdesk.ticket']
+        domain = [('team_id', '=', self.test_team.id)]
+        count = Ticket._get_approximate_count(domain)
+        self.assertEqual(count, Ticket.search_count(domain))
+        Ticket.create({'name': 'test ticket', 'team_id': self.test_team.id})
+        # cached for the same user and domain
+        self.assertEqual(Ticket._get_approximate_count(domain), count)
+        self.assertEqual(Ticket.with_user(self.helpdesk_manager)._get_approximate_count(domain), count + 1)
@@ -185,6 +185,114 @@ class HelpdeskSLA(TransactionCase):
         ticket.tag_ids = [(5,)]  # Remove all tags
         self.assertFalse(ticket.sla_status_ids, "SLA should no longer apply")
 
+    def test_sla_reapply_keeps_status(self):
+        """ Changing a field of the ticket without changing the SLA to apply should keep its SLA status untouched """
+        ticket = self.create_ticket(tag_ids=self.tag_urgent)
+        status = ticket.sla_status_ids
+        self.assertEqual(status.sla_id, self.sla, "SLA should have been applied")
+        ticket.tag_ids = [(4, self.tag_vip.id)]
+        self.assertEqual(ticket.sla_status_ids, status, "The SLA status should not have been recreated")
+        ticket.tag_ids = [(4, self.tag_freeze.id)]
+        self.assertEqual(ticket.sla_status_ids.sla_id, self.sla | self.sla_2, "The new SLA should have been applied")
+        self.assertIn(status, ticket.sla_status_ids, "The SLA status still matched should have been kept")
+
+    def test_sla_reach_batch(self):
+        """ Moving tickets in batch should flag their SLA status as reached and update the dependent fields """
+        tickets = self.env['helpdesk.ticket'].concat(*(self.create_ticket() for dummy in range(3)))
+        self.assertTrue(all(tickets.mapped('sla_deadline')), "Tickets should have a SLA deadline")
+        tickets.write({'stage_id': self.stage_progress.id})
+        statuses = tickets.sla_status_ids
+        self.assertEqual(len(statuses), 3)
+        self.assertTrue(all(statuses.mapped('reached_datetime')), "SLA status should have been reached")
+        self.assertEqual(statuses.mapped('status'), ['reached'] * 3)
+        self.assertFalse(any(tickets.mapped('sla_deadline')), "Tickets should no longer have a SLA deadline")
+
+    def test_sla_breach_cron(self):
+        """ The breach cron should flag the ongoing SLA as failed once their deadline passed """
+        ticket = self.create_ticket()
+        status = ticket.sla_status_ids
+        deadline = status.deadline
+        self.assertEqual(status.status, 'ongoing')
+        self.assertFalse(ticket.sla_fail)
+        with patch.object(fields.Datetime, 'now', lambda: deadline + relativedelta(minutes=1)):
+            self.env['helpdesk.sla.status']._cron_sla_breach()
+        self.assertEqual(status.status, 'failed', "The SLA status should have been flagged as failed")
+        self.assertTrue(ticket.sla_fail, "The ticket should have been flagged as failed")
+        self.assertEqual(self.env['helpdesk.ticket'].search([('id', '=', ticket.id), ('sla_fail', '=', True)]), ticket)
+
+    def test_sla_breach_cron_dashboard(self):
+        """ The breach cron should push the SLA failed on the dashboard of the assigned user """
+        ticket = self.create_ticket(user_id=self.env.user.id)
+        deadline = ticket.sla_status_ids.deadline
+        with patch.object(self.env.registry['bus.bus'], '_sendmany', autospec=True) as sendmany, \
+                patch.object(fields.Datetime, 'now', lambda: deadline + relativedelta(minutes=1)):
+            self.env['helpdesk.sla.status']._cron_sla_breach()
+        [payload] = [
+            payload
+            for call in sendmany.call_args_list
+            for partner, notification_type, payload in call[0][1]
+            if notification_type == 'helpdesk.dashboard/update'
+        ]
+        self.assertEqual(payload['changes']['my_all'], {'failed': 1})
+
+    def test_sla_partner_hierarchy(self):
+        """ SLA on a company applies to the tickets of its contacts, and SLA on a contact to the tickets of its company """
+        company = self.env['res.partner'].create({'name': 'SLA Company', 'is_company': True})
+        contact = self.env['res.partner'].create({'name': 'SLA Contact', 'parent_id': company.id})
+        other = self.env['res.partner'].create({'name': 'SLA Other'})
+        self.sla.partner_ids = company
+        self.assertEqual(self.create_ticket(partner_id=contact.id).sla_status_ids.sla_id, self.sla, "SLA should have been applied")
+        self.assertFalse(self.create_ticket(partner_id=other.id).sla_status_ids, "SLA should not have been applied")
+        self.sla.partner_ids = contact
+        self.assertEqual(self.create_ticket(partner_id=company.id).sla_status_ids.sla_id, self.sla, "SLA should have been applied")
+
+    def test_sla_find_extra_domain(self):
+        """ The SLA policies matched by the index should be narrowed by the extra domain of the tickets """
+        ticket = self.create_ticket(tag_ids=self.tag_freeze)
+        self.assertEqual(ticket.sla_status_ids.sla_id, self.sla | self.sla_2, "SLA should have been applied")
+        Ticket = self.env.registry['helpdesk.ticket']
+        with patch.object(Ticket, '_sla_find_extra_domain', lambda ticket: [('id', '!=', self.sla_2.id)]):
+            ticket = self.create_ticket(tag_ids=self.tag_freeze)
+        self.assertEqual(ticket.sla_status_ids.sla_id, self.sla, "SLA excluded by the extra domain should not have been applied")
+
+    def test_sla_deadline_batch(self):
+        """ Deadlines resolved in batch on the in-memory timeline should match the ones planned
+            ticket per ticket on the working calendar """
+        calendar = self.test_team.resource_calendar_id
+        avg_hour = calendar.hours_per_day or 8
+        self.sla.time = avg_hour + 3
+        tickets = self.env['helpdesk.ticket'].concat(*(self.create_ticket() for dummy in range(4)))
+        create_dates = ['2019-01-04 07:00:00', '2019-01-04 15:30:00', '2019-01-05 10:00:00', '2019-01-07 20:00:00']
+        for ticket, create_date in zip(tickets, create_dates):
+            self._utils_set_create_date(ticket, create_date)
+        statuses = tickets.sla_status_ids.filtered(lambda status: status.sla_id == self.sla)
+        statuses.write({'deadline': False})
+        statuses._compute_deadline()
+        for status in statuses:
+            create_date = status.ticket_id.create_date
+            deadline = calendar.plan_days(2, create_date, compute_leaves=True)
+            create_dt = calendar.plan_hours(0, create_date)
+            deadline = deadline.replace(hour=create_dt.hour, minute=create_dt.minute, second=create_dt.second,
+                                        microsecond=create_dt.microsecond)
+            self.assertEqual(status.deadline, calendar.plan_hours(3, deadline, compute_leaves=True))
+
+    def test_work_duration_batch(self):
+        """ Working durations computed in batch on the cumulated timeline should match the ones computed
+            period per period on the working calendar """
+        calendar = self.test_team.resource_calendar_id
+        periods = [
+            (datetime(2019, 1, 4, 7, 0), datetime(2019, 1, 4, 15, 30)),
+            (datetime(2019, 1, 4, 15, 30), datetime(2019, 1, 7, 10, 15)),
+            (datetime(2019, 1, 5, 10, 0), datetime(2019, 1, 6, 10, 0)),
+            (datetime(2019, 1, 2, 9, 45), datetime(2019, 1, 22, 14, 5)),
+            (datetime(2019, 1, 8, 12, 0), datetime(2019, 1, 8, 9, 0)),
+        ]
+        durations = calendar._get_work_duration_data_batch(periods, compute_leaves=True)
+        for (start_dt, end_dt), duration_data in zip(periods, durations):
+            expected = calendar.get_work_duration_data(start_dt, end_dt, compute_leaves=True)
+            self.assertEqual(duration_data['days'], expected['days'])
+            self.assertAlmostEqual(duration_data['hours'], expected['hours'], places=6)
+
     @patch.object(fields.Datetime, 'now', lambda: NOW2)
     def test_sla_waiting(self):
         ticket = self.create_ticket(tag_ids=self.tag_freeze)
@@ -192,44 +300,192 @@ class HelpdeskSLA(TransactionCase):
         status = ticket.sla_status_ids.filtered(lambda sla: sla.sla_id.id == self.sla_2.id)
         self.assertEqual(status.deadline, datetime(2019, 1, 9, 12, 2, 0), 'No waiting time, deadline = creation date + 1 day + 2 hours + 2 minutes')
 
-        ticket.write({'stage_id': self.stage_progress.id})
-        initial_values = {ticket.id: {'stage_id': self.stage_new}}
-        ticket.message_track(['stage_id'], initial_values)
-        self._utils_set_create_date(ticket.message_ids.tracking_value_ids, '2019-01-08 11:09:50', ticket)
-        self.assertEqual(status.deadline, datetime(2019, 1, 9, 12, 2, 0), 'No waiting time, deadline = creation date + 1 day + 2 hours + 2 minutes')
+        with patch.object(fields.Datetime, 'now', lambda: datetime(2019, 1, 8, 11, 9, 50)):
+            ticket.write({'stage_id': self.stage_progress.id})
+            self.assertEqual(status.deadline, datetime(2019, 1, 9, 12, 2, 0), 'No waiting time, deadline = creation date + 1 day + 2 hours + 2 minutes')
 
         # We are in waiting stage, they are no more deadline.
-        ticket.write({'stage_id': self.stage_wait.id})
-        initial_values = {ticket.id: {'stage_id': self.stage_progress}}
-        ticket.message_track(['stage_id'], initial_values)
-        self._utils_set_create_date(ticket.message_ids.tracking_value_ids[0], '2019-01-08 12:15:00', ticket)
-        self.assertFalse(status.deadline, 'In waiting stage: no more deadline')
+        with patch.object(fields.Datetime, 'now', lambda: datetime(2019, 1, 8, 12, 15, 0)):
+            ticket.write({'stage_id': self.stage_wait.id})
+            self.assertFalse(status.deadline, 'In waiting stage: no more deadline')
+            self.assertEqual(status.freeze_start, datetime(2019, 1, 8, 12, 15, 0), 'The freeze period should have started')
 
         #  We have a response of our customer, the ticket switch to in progress stage (outside working hours)
-        ticket.write({'stage_id': self.stage_progress.id})
-        initial_values = {ticket.id: {'stage_id': self.stage_wait}}
-        ticket.message_track(['stage_id'], initial_values)
-        self._utils_set_create_date(ticket.message_ids.tracking_value_ids[0], '2019-01-12 10:35:58', ticket)
-        # waiting time = 3 full working days 9 - 10 - 11 January (12 doesn't count as it's Saturday)
-        #  + (8 January) 12:15:00 -> 16:00:00 (end of working day) 3,75 hours
-        # Old deadline = '2019-01-09 12:02:00'
-        # New: '2019-01-09 12:02:00' + 3 days (waiting) + 2 days (weekend) + 3.75 hours (waiting) = '2019-01-14 15:47:00'
-        self.assertEqual(status.deadline, datetime(2019, 1, 14, 15, 47), 'We have waiting time: deadline = old_deadline + 3 full working days (waiting) + 3.75 hours (waiting) + 2 days (weekend)')
-
-        ticket.write({'stage_id': self.stage_wait.id})
-        initial_values = {ticket.id: {'stage_id': self.stage_progress}}
-        ticket.message_track(['stage_id'], initial_values)
-        self._utils_set_create_date(ticket.message_ids.tracking_value_ids[0], '2019-01-14 15:30:00', ticket)
-        self.assertFalse(status.deadline, 'In waiting stage: no more deadline')
-
-        # We need to patch now with a new value as it will be used to compute freezed time.
+        with patch.object(fields.Datetime, 'now', lambda: datetime(2019, 1, 12, 10, 35, 58)):
+            ticket.write({'stage_id': self.stage_progress.id})
+            # waiting time = 3 full working days 9 - 10 - 11 January (12 doesn't count as it's Saturday)
+            #  + (8 January) 12:15:00 -> 16:00:00 (end of working day) 3,75 hours
+            # Old deadline = '2019-01-09 12:02:00'
+            # New: '2019-01-09 12:02:00' + 3 days (waiting) + 2 days (weekend) + 3.75 hours (waiting) = '2019-01-14 15:47:00'
+            self.assertFalse(status.freeze_start, 'The freeze period should be closed')
+            self.assertAlmostEqual(status.freezed_hours, 27.75, places=4, msg='The freezed working hours should be accumulated in the ledger')
+            self.assertEqual(status.deadline, datetime(2019, 1, 14, 15, 47), 'We have waiting time: deadline = old_deadline + 3 full working days (waiting) + 3.75 hours (waiting) + 2 days (weekend)')
+
+        with patch.object(fields.Datetime, 'now', lambda: datetime(2019, 1, 14, 15, 30, 0)):
+            ticket.write({'stage_id': self.stage_wait.id})
+            self.assertFalse(status.deadline, 'In waiting stage: no more deadline')
+
         with patch.object(fields.Datetime, 'now', lambda: datetime(2019, 1, 16, 15, 0)):
             ticket.write({'stage_id': self.stage_done.id})
-            initial_values = {ticket.id: {'stage_id': self.stage_wait}}
-            ticket.message_track(['stage_id'], initial_values)
-            self._utils_set_create_date(ticket.message_ids.tracking_value_ids[0], '2019-01-16 15:00:00', ticket)
             self.assertEqual(status.deadline, datetime(2019, 1, 16, 15, 17), 'We have waiting time: deadline = old_deadline +  7.5 hours (waiting)')
 
+    def test_team_stats(self):
+        def expected_stats():
+            Ticket = self.env['helpdesk.ticket']
+            tomorrow = fields.Datetime.to_string(fields.Date.today() + relativedelta(days=1))
+            return {
+                'open_ticket_count': Ticket.search_count([('team_id', '=', self.test_team.id), ('stage_id.is_close', '=', False)]),
+                'unassigned_tickets': Ticket.search_count([('team_id', '=', self.test_team.id), ('user_id', '=', False), ('stage_id.is_close', '!=', True)]),
+                'upcoming_sla_fail_tickets': Ticket.search_count([('team_id', '=', self.test_team.id), ('sla_deadline', '!=', False), ('sla_deadline', '<=', tomorrow)]),
+                'sla_policy_count': self.env['helpdesk.sla'].search_count([('team_id', '=', self.test_team.id)]),
+            }
+
+        def assert_stats():
+            self.test_team.invalidate_cache()
+            expected = expected_stats()
+            self.assertEqual(self.test_team.read(list(expected))[0], dict(expected, id=self.test_team.id))
+            # the rows of differences merged together give the same counters
+            self.env['helpdesk.team.stats']._merge()
+            self.assertEqual(self.env['helpdesk.team.stats'].search_count([('team_id', '=', self.test_team.id)]), 1)
+            self.test_team.invalidate_cache()
+            self.assertEqual(self.test_team.read(list(expected))[0], dict(expected, id=self.test_team.id))
+            # the consistency check finds the same counters
+            self.env['helpdesk.team.stats']._rebuild()
+            self.test_team.invalidate_cache()
+            self.assertEqual(self.test_team.read(list(expected))[0], dict(expected, id=self.test_team.id))
+
+        tickets = self.create_ticket(priority='2') | self.create_ticket(user_id=self.helpdesk_user.id)
+        ticket_late = self.create_ticket(tag_ids=self.tag_freeze)
+        self._utils_set_create_date(ticket_late, '2019-01-08 12:00:00', ticket_late)
+        self.assertTrue(ticket_late.sla_deadline)
+        # the deadline changed in SQL, behind the back of the statistics
+        self.env['helpdesk.team.stats']._rebuild()
+        assert_stats()
+
+        tickets[0].write({'user_id': self.helpdesk_user.id})
+        tickets[1].write({'stage_id': self.stage_done.id})
+        assert_stats()
+
+        self.stage_done.write({'is_close': False})
+        assert_stats()
+        self.stage_done.write({'is_close': True})
+
+        self.sla_2.write({'active': False})
+        ticket_late.write({'priority': '3'})
+        assert_stats()
+
+        (tickets | ticket_late).unlink()
+        self.sla.unlink()
+        assert_stats()
+
+    def test_dashboard_data(self):
+        self.test_team.use_rating = True
+        self.create_ticket(user_id=self.env.user.id, priority='2')
+        self.create_ticket(user_id=self.env.user.id, priority='3')
+        closed_ticket = self.create_ticket(user_id=self.env.user.id, priority='3')
+        self.create_ticket(user_id=self.helpdesk_user.id, priority='3')
+
+        data = self.env['helpdesk.team'].retrieve_dashboard()
+        self.assertEqual(data['my_all']['count'], 3)
+        self.assertEqual(data['my_high']['count'], 1)
+        self.assertEqual(data['my_urgent']['count'], 2)
+        self.assertEqual(data['today']['count'], 0)
+        self.assertEqual(data['helpdesk_target_closed'], self.env.user.helpdesk_target_closed)
+        DashboardVersion = self.env['helpdesk.dashboard.version']
+        version = DashboardVersion._get_version()
+
+        # closing and rating a ticket refreshes the dashboard
+        closed_ticket.write({'stage_id': self.stage_done.id})
+        self.assertGreater(DashboardVersion._get_version(), version, "The version of the statistics should have been bumped")
+        self.env['rating.rating'].create({
+            'res_model_id': self.env['ir.model']._get_id('helpdesk.ticket'),
+            'res_id': closed_ticket.id,
+            'rating': 5,
+            'consumed': True,
+        })
+        data = self.env['helpdesk.team'].retrieve_dashboard()
+        self.assertEqual(data['my_all']['count'], 2)
+        self.assertEqual(data['my_urgent']['count'], 1)
+        self.assertEqual(data['today']['count'], 1)
+        self.assertEqual(data['7days']['count'], 1)
+        self.assertEqual(data['today']['rating'], 100)
+        self.assertEqual(data['7days']['rating'], 100)
+
+    def test_dashboard_notifications(self):
+        self.test_team.use_rating = True
+        BusBus = self.env.registry['bus.bus']
+
+        def dashboard_notifications(sendmany):
+            return [
+                (partner, payload)
+                for call in sendmany.call_args_list
+                for partner, notification_type, payload in call[0][1]
+                if notification_type == 'helpdesk.dashboard/update'
+            ]
+
+        with patch.object(BusBus, '_sendmany', autospec=True) as sendmany:
+            ticket = self.create_ticket(user_id=self.env.user.id, priority='3')
+            [(partner, payload)] = dashboard_notifications(sendmany)
+            self.assertEqual(partner, self.env.user.partner_id)
+            self.assertEqual(payload['company_id'], ticket.company_id.id)
+            self.assertEqual(payload['changes']['my_all']['count'], 1)
+            self.assertEqual(payload['changes']['my_urgent']['count'], 1)
+            self.assertNotIn('my_high', payload['changes'])
+
+            sendmany.reset_mock()
+            ticket.write({'stage_id': self.stage_done.id})
+            [(partner, payload)] = dashboard_notifications(sendmany)
+            self.assertEqual(payload['changes']['my_all']['count'], -1)
+            self.assertEqual(payload['changes']['my_urgent']['count'], -1)
+            self.assertEqual(payload['changes']['today']['count'], 1)
+            self.assertEqual(payload['changes']['7days']['count'], 1)
+
+            sendmany.reset_mock()
+            self.env['rating.rating'].create({
+                'res_model_id': self.env['ir.model']._get_id('helpdesk.ticket'),
+                'res_id': ticket.id,
+                'rating': 5,
+                'consumed': True,
+            })
+            [(partner, payload)] = dashboard_notifications(sendmany)
+            self.assertEqual(payload['changes'], {'today': {'great': 1}, '7days': {'great': 1}})
+
+            # a change not shown on the dashboard is not pushed
+            sendmany.reset_mock()
+            ticket.write({'priority': '2'})
+            self.assertFalse(dashboard_notifications(sendmany))
+
+            # the tickets of a stage no longer closing are open again
+            sendmany.reset_mock()
+            version = self.env['helpdesk.dashboard.version']._get_version()
+            self.stage_done.write({'is_close': False})
+            [(partner, payload)] = dashboard_notifications(sendmany)
+            self.assertEqual(payload['changes']['my_all']['count'], 1)
+            self.assertEqual(payload['changes']['today']['count'], -1)
+            self.assertGreater(self.env['helpdesk.dashboard.version']._get_version(), version)
+
+    def test_dashboard_success_rate(self):
+        self.env.user.groups_id |= self.env.ref('helpdesk.group_use_sla')
+        tickets = self.env['helpdesk.ticket'].create([{
+            'name': 'Ticket %s' % i,
+            'team_id': self.test_team.id,
+            'user_id': self.env.user.id,
+        } for i in range(4)])
+        tickets.write({'stage_id': self.stage_done.id})
+        tickets.flush()
+        # one ticket out of four closed late, and one closed with the deadline of an SLA not reached passed: only
+        # the SLA reached late fail the closed tickets
+        self.env.cr.execute("UPDATE helpdesk_ticket SET sla_reached_late = TRUE WHERE id = %s", (tickets[0].id,))
+        self.env.cr.execute("UPDATE helpdesk_ticket SET sla_deadline = %s WHERE id = %s",
+                            (fields.Datetime.now() - relativedelta(hours=1), tickets[1].id))
+        tickets.invalidate_cache(['sla_reached_late', 'sla_deadline'])
+
+        data = self.env['helpdesk.team'].retrieve_dashboard()
+        self.assertTrue(data['success_rate_enable'])
+        self.assertEqual(data['today']['count'], 4)
+        self.assertEqual(data['today']['success'], 75)
+        self.assertEqual(data['7days']['success'], 75)
+
     @patch.object(fields.Date, 'today', lambda: NOW.date())
     @patch.object(fields.Datetime, 'today', lambda: NOW.replace(hour=0, minute=0, second=0))
     @patch.object(fields.Datetime, 'now', lambda: NOW)
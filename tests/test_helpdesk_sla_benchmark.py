@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import logging
+
+from odoo import fields
+from odoo.tests.common import TransactionCase, tagged
+
+_logger = logging.getLogger(__name__)
+
+
+@tagged('-standard', 'helpdesk_benchmark', 'post_install', '-at_install')
+class TestHelpdeskSLABenchmark(TransactionCase):
+    """ Log the query plans of the hot SLA queries with and without the indexes created by
+        `helpdesk.sla.status.init`. Run it with `--test-tags helpdesk_benchmark`.
+    """
+    STATUS_COUNT = 50000
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestHelpdeskSLABenchmark, cls).setUpClass()
+        team = cls.env['helpdesk.team'].create({'name': 'Benchmark Team', 'use_sla': True})
+        cls.stage = cls.env['helpdesk.stage'].create({'name': 'Benchmark Stage', 'team_ids': [(4, team.id)]})
+        cls.sla = cls.env['helpdesk.sla'].create({
+            'name': 'Benchmark SLA',
+            'team_id': team.id,
+            'stage_id': cls.stage.id,
+            'time': 8,
+        })
+        cls.tickets = cls.env['helpdesk.ticket'].create([
+            {'name': 'Benchmark %s' % i, 'team_id': team.id} for i in range(50)
+        ])
+        cls.env['base'].flush()
+        # one reached status out of ten, deadlines spread over a year
+        cls.env.cr.execute("""
+            INSERT INTO helpdesk_sla_status (ticket_id, sla_id, sla_stage_id, deadline, reached_datetime, status)
+                 SELECT (%(ticket_ids)s)[1 + i %% %(ticket_count)s], %(sla_id)s, %(stage_id)s,
+                        %(now)s + (i %% 365 - 180) * interval '1 day',
+                        CASE WHEN i %% 10 = 0 THEN %(now)s ELSE NULL END,
+                        CASE WHEN i %% 10 = 0 THEN 'reached' WHEN i %% 365 < 180 THEN 'failed' ELSE 'ongoing' END
+                   FROM generate_series(1, %(count)s) AS i
+        """, {
+            'ticket_ids': cls.tickets.ids,
+            'ticket_count': len(cls.tickets),
+            'sla_id': cls.sla.id,
+            'stage_id': cls.stage.id,
+            'now': fields.Datetime.now(),
+            'count': cls.STATUS_COUNT,
+        })
+        cls.env.cr.execute("ANALYZE helpdesk_sla_status")
+
+    def _explain(self, query, params):
+        self.env.cr.execute("EXPLAIN " + query, params)
+        return "\n".join(row[0] for row in self.env.cr.fetchall())
+
+    def _get_queries(self):
+        now = fields.Datetime.now()
+        ticket_ids = tuple(self.tickets[:5].ids)
+        return {
+            'reached_late': ("""
+                SELECT ticket_id, COUNT(id) AS reached_late_count
+                FROM helpdesk_sla_status
+                WHERE ticket_id IN %s AND (deadline < reached_datetime OR (deadline < %s AND reached_datetime IS NULL))
+                GROUP BY ticket_id
+            """, (ticket_ids, now)),
+            'sla_reach': ("""
+                SELECT id FROM helpdesk_sla_status
+                WHERE ticket_id IN %s AND reached_datetime IS NULL AND sla_stage_id IN %s
+            """, (ticket_ids, (self.stage.id,))),
+            'breach_queue': ("""
+                SELECT id FROM helpdesk_sla_status
+                WHERE status = 'ongoing' AND deadline <= %s
+                ORDER BY deadline
+            """, (now,)),
+        }
+
+    def test_sla_status_query_plans(self):
+        SLAStatus = self.env['helpdesk.sla.status']
+        indexes = SLAStatus._get_sla_status_indexes()
+        queries = self._get_queries()
+
+        for index_name in indexes:
+            self.env.cr.execute("DROP INDEX IF EXISTS %s" % index_name)
+        plans_before = {name: self._explain(*query) for name, query in queries.items()}
+
+        SLAStatus.init()
+        plans_after = {name: self._explain(*query) for name, query in queries.items()}
+
+        for name in queries:
+            _logger.info("Query plan of %s before:\n%s\nafter:\n%s", name, plans_before[name], plans_after[name])
+        self.assertIn('helpdesk_sla_status_ongoing_deadline_index', plans_after['breach_queue'],
+                      "The breach queue should be read from its partial index")
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import logging
+from unittest.mock import patch
+
+from .common import HelpdeskCommon
+from odoo.addons.helpdesk.models.helpdesk_ticket import HelpdeskTicket
+from odoo.tests.common import tagged
+
+_logger = logging.getLogger(__name__)
+
+
+def _legacy_write_with_dates(self, vals, date_names, now):
+    """ The write of the tickets before the single pass write: one write for each subset of the tickets getting
+        an assignation date, a closing date, both or none of them, even when the subset is empty.
+    """
+    assigned_tickets = self.filtered(lambda ticket: 'assign_date' in date_names and not ticket.assign_date)
+    closed_tickets = self.filtered(lambda ticket: 'close_date' in date_names and not ticket.close_date)
+    res = super(HelpdeskTicket, self - assigned_tickets - closed_tickets).write(vals)
+    res &= super(HelpdeskTicket, assigned_tickets - closed_tickets).write(dict(vals, assign_date=now))
+    res &= super(HelpdeskTicket, closed_tickets - assigned_tickets).write(dict(vals, close_date=now))
+    res &= super(HelpdeskTicket, assigned_tickets & closed_tickets).write(dict(vals, assign_date=now, close_date=now))
+    return res
+
+
+@tagged('helpdesk_benchmark', 'post_install', '-at_install')
+class TestHelpdeskTicketBenchmark(HelpdeskCommon):
+    """ Count the queries of a mass edit of tickets (as done from the list view), compared with the former write
+        of the tickets, and for growing batches. Run it alone with `--test-tags helpdesk_benchmark`.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestHelpdeskTicketBenchmark, cls).setUpClass()
+        cls.setUpSLATeam()
+
+    def _create_tickets(self, count):
+        tickets = self.env['helpdesk.ticket'].create([{
+            'name': 'Benchmark %s' % i,
+            'team_id': self.team_with_sla.id,
+            'user_id': self.helpdesk_manager.id if i % 2 else False,
+        } for i in range(count)])
+        tickets.flush()
+        tickets.invalidate_cache()
+        return tickets
+
+    def _mass_edit_query_count(self, count, context=None):
+        tickets = self._create_tickets(count)
+        query_count = self.env.cr.sql_log_count
+        tickets.with_context(**(context or {'tracking_disable': True})).write({
+            'stage_id': self.team_sla_stage_done.id,
+            'user_id': self.helpdesk_user.id,
+        })
+        tickets.flush()
+        return self.env.cr.sql_log_count - query_count
+
+    def test_mass_edit_query_count(self):
+        # warm up the caches (SLA index, stages, ...)
+        self._mass_edit_query_count(2)
+        query_counts = {count: self._mass_edit_query_count(count) for count in (10, 100)}
+        _logger.info("Queries of the mass edit of tickets (count: queries): %s", query_counts)
+        self.assertLessEqual(query_counts[100], query_counts[10] + 10,
+                             "The number of queries of a mass edit should not grow with the number of tickets")
+
+    def test_mass_edit_query_count_legacy(self):
+        """ The budget of the mass edit is the count of queries of the former write, measured in the same run on
+            the same tickets: the former write did the four writes (with the tracking and the followers of each
+            one), where the single pass write skips the empty groups.
+        """
+        # list view mass edit: tracked, without the assignation emails
+        context = {'mail_auto_subscribe_no_notify': True}
+        self._mass_edit_query_count(2, context)
+        with patch.object(HelpdeskTicket, '_write_with_dates', _legacy_write_with_dates):
+            self._mass_edit_query_count(2, context)
+            legacy_query_count = self._mass_edit_query_count(10, context)
+        query_count = self._mass_edit_query_count(10, context)
+        _logger.info("Queries of the mass edit of 10 tickets: %s, with the former write: %s", query_count, legacy_query_count)
+        self.assertLessEqual(query_count, legacy_query_count,
+                             "The single pass write should not do more queries than the former write")